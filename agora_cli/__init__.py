@@ -19,5 +19,4 @@
 
 __author__ = 'Fernando Serena'
 
-from agora_cli import list, get, show, add, delete, compute, discover, query, publish, init, qgl, learn, export
 from agora_cli.root import cli
\ No newline at end of file
@@ -18,10 +18,9 @@
 """
 
 import click
-from agora_gw.gateway import GatewayError, ConflictError, NotFoundError
 
 from agora_cli.root import cli
-from agora_cli.utils import check_init, store_host_replacements, jsonify, error, show_thing
+from agora_cli.utils import check_init, store_host_replacements, store_host_limits, jsonify, error, show_thing
 
 __author__ = 'Fernando Serena'
 
@@ -38,6 +37,8 @@ def add(ctx):
 @click.option('--turtle', default=False, is_flag=True)
 @click.pass_context
 def add_resource(ctx, uri, type, turtle):
+    from agora_gw.gateway import GatewayError, ConflictError
+
     gw = ctx.obj['gw']
     try:
         r = gw.add_resource(uri, type)
@@ -54,6 +55,8 @@ def add_resource(ctx, uri, type, turtle):
 @click.option('--turtle', default=False, is_flag=True)
 @click.pass_context
 def add_td(ctx, id, type, turtle):
+    from agora_gw.gateway import GatewayError, ConflictError
+
     gw = ctx.obj['gw']
     try:
         td = gw.add_description(id, type)
@@ -71,6 +74,8 @@ def add_td(ctx, id, type, turtle):
 @click.option('--replace', default=False, is_flag=True)
 @click.pass_context
 def add_enrichment(ctx, id, td, type, replace):
+    from agora_gw.gateway import NotFoundError, GatewayError, ConflictError
+
     gw = ctx.obj['gw']
     try:
         e = gw.add_enrichment(id, type, td, replace=replace)
@@ -88,6 +93,8 @@ def add_enrichment(ctx, id, td, type, replace):
 @click.argument('link')
 @click.pass_context
 def add_access_mapping(ctx, id, link):
+    from agora_gw.gateway import NotFoundError, GatewayError, ConflictError
+
     gw = ctx.obj['gw']
     try:
         am = gw.add_access_mapping(id, link)
@@ -110,6 +117,8 @@ def add_access_mapping(ctx, id, link):
 @click.option('--transformed-by')
 @click.pass_context
 def add_mapping(ctx, id, amid, predicate, key, jsonpath, root, transformed_by):
+    from agora_gw.gateway import NotFoundError, GatewayError, ConflictError
+
     gw = ctx.obj['gw']
     try:
         m = gw.add_mapping(id, amid, predicate, key, jsonpath, root, transformed_by)
@@ -137,11 +146,35 @@ def add_host_replacement(ctx, base, replace):
     store_host_replacements(ctx.obj['repls'])
 
 
+@add_host.command('limit')
+@click.argument('host')
+@click.option('--concurrency', type=int)
+@click.option('--rate', type=float)
+@click.option('--burst', type=int)
+@click.option('--retries', type=int)
+@click.option('--backoff', type=float)
+@click.pass_context
+def add_host_limit(ctx, host, concurrency, rate, burst, retries, backoff):
+    limit = ctx.obj['limits'].get(host, {})
+    for key, value in [('concurrency', concurrency), ('rate', rate), ('burst', burst), ('retries', retries),
+                       ('backoff', backoff)]:
+        if value is not None:
+            limit[key] = value
+    ctx.obj['limits'][host] = limit
+    store_host_limits(ctx.obj['limits'])
+    click.echo(jsonify(limit))
+
+
 @add.command('prefix')
 @click.argument('prefix')
 @click.argument('ns')
 @click.pass_context
 def add_prefix(ctx, prefix, ns):
+    from agora_cli.paths import update_path_index
+    from agora_cli.plans import invalidate_plans
+
     gw = ctx.obj['gw']
     gw.agora.fountain.add_prefixes({prefix: ns})
+    invalidate_plans()
+    update_path_index(gw.agora.fountain)
     print jsonify(gw.agora.fountain.prefixes)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import math
+import os
+import os.path as path
+import resource
+import sys
+import time
+
+import click
+
+from agora_cli.cache import MEMORY_CACHE_SIZE, get_cache, get_cache_kv, clear_memory, clear_fragments
+from agora_cli.loader import CONCURRENCY, loaders, set_concurrency, set_stand_in
+from agora_cli.mock import mock_uri
+from agora_cli.root import cli, version
+from agora_cli.synthetic import NAMESPACE, PREFIX, SPEC_FILE, Synthetic
+from agora_cli.timing import timings
+from agora_cli.utils import split_arg, check_init, jsonify, store_host_replacements
+
+__author__ = 'Fernando Serena'
+
+# Benchmarks keep their own resource cache and fragments, so cold runs can wipe them
+BENCH_BASE = '.agora/store/bench'
+BENCH_CACHE = '{}/data.db'.format(BENCH_BASE)
+BENCH_FRAGMENTS = '{}/fragments'.format(BENCH_BASE)
+RUNS = 5
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    # Nearest rank of sorted values
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1))]
+
+
+def distribution(values):
+    values = sorted(values)
+    if not values:
+        return None
+    dist = dict([('p{}'.format(p), round(percentile(values, p), 4)) for p in PERCENTILES])
+    dist['min'] = round(values[0], 4)
+    dist['max'] = round(values[-1], 4)
+    dist['mean'] = round(sum(values) / len(values), 4)
+    return dist
+
+
+def peak_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def dereferenced():
+    return sum([l.requests for l in loaders.values()]), sum([l.not_modified for l in loaders.values()])
+
+
+def bench_cache(memory_size):
+    if not path.isdir(BENCH_BASE):
+        os.makedirs(BENCH_BASE)
+    return get_cache(BENCH_CACHE, memory_size=memory_size)
+
+
+def chill():
+    """
+    Leaves the benchmark cache cold: resources, validators, fragments and the in-process tier.
+    """
+    get_cache_kv(BENCH_CACHE).flushdb()
+    clear_fragments(BENCH_FRAGMENTS)
+    clear_memory()
+
+
+def measure(run):
+    """
+    Times one run, a generator of results, and what it dereferenced.
+    """
+    requests, not_modified = dereferenced()
+    since = timings.snapshot()
+    items = 0
+    first = None
+    error = None
+    start = time.time()
+    try:
+        for _ in run():
+            if first is None:
+                first = time.time() - start
+            items += 1
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    latency = time.time() - start
+
+    after_requests, after_not_modified = dereferenced()
+    return {
+        'latency': latency,
+        'first': first,
+        'items': items,
+        'resources': after_requests - requests,
+        'not_modified': after_not_modified - not_modified,
+        'phases': timings.summary(since=since),
+        'error': error
+    }
+
+
+def summarize(runs, unit=None):
+    ok = [r for r in runs if r['error'] is None]
+    summary = {
+        'runs': len(runs),
+        'errors': len(runs) - len(ok),
+        'latency': distribution([r['latency'] for r in ok]),
+        'resources': sum([r['resources'] for r in runs]) / float(len(runs)),
+        'not_modified': sum([r['not_modified'] for r in runs]) / float(len(runs)),
+        'peak_rss': peak_rss()
+    }
+    if len(ok) < len(runs):
+        summary['error_messages'] = sorted(set([r['error'] for r in runs if r['error'] is not None]))
+    if unit is not None:
+        elapsed = sum([r['latency'] for r in ok])
+        items = sum([r['items'] for r in ok])
+        summary['first_{}'.format(unit[:-1])] = distribution([r['first'] for r in ok if r['first'] is not None])
+        summary[unit] = round(items / float(len(ok)), 2) if ok else 0
+        summary['{}_per_second'.format(unit)] = round(items / elapsed, 2) if elapsed else None
+
+    phases = {}
+    for r in ok:
+        for phase, acc in r['phases'].items():
+            phases[phase] = phases.get(phase, 0.0) + acc['seconds']
+    summary['phases'] = dict([(phase, round(seconds / len(ok), 4)) for phase, seconds in phases.items()])
+    return summary
+
+
+def bench_runs(ctx, command, q, run, runs, unit, mock, record, latency, output, **settings):
+    """
+    Runs a query cold (on an empty benchmark cache) and then warm runs times each, optionally against a local
+    stand-in of the ecosystem hosts that serves the resources under mock, and reports both.
+    """
+    from agora_cli.mock import MockServer
+
+    server = None
+    if mock:
+        server = MockServer(mock, record=record, latency=latency / 1000.0).start()
+        set_stand_in(server.base)
+
+    timings.enabled = True
+    start = time.time()
+    # The gateway is opened once, like a long-running server does
+    ctx.obj['gw'].gateway
+    setup = time.time() - start
+
+    try:
+        cold = []
+        for _ in range(runs):
+            chill()
+            cold.append(measure(run))
+        warm = [measure(run) for _ in range(runs)]
+    finally:
+        if server is not None:
+            set_stand_in(None)
+            server.shutdown()
+
+    report = dict(settings)
+    report.update({
+        'command': command,
+        'query': q,
+        'version': version(),
+        'setup': round(setup, 4),
+        'cold': summarize(cold, unit),
+        'warm': summarize(warm, unit),
+        'peak_rss': peak_rss()
+    })
+    if server is not None:
+        report['stand_in'] = dict(server.stats, root=mock, record=record, latency_ms=latency)
+
+    click.echo(jsonify(report))
+    if output:
+        with open(output, 'w') as f:
+            f.write(jsonify(report))
+
+
+@cli.group()
+@click.pass_context
+def bench(ctx):
+    check_init(ctx)
+
+
+@bench.command('query')
+@click.argument('q')
+@click.option('--arg', multiple=True)
+@click.option('--incremental', is_flag=True, default=False)
+@click.option('--ignore-cycles', is_flag=True, default=False)
+@click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
+@click.option('--host', default='agora')
+@click.option('--port', default=80)
+@click.option('--runs', type=click.IntRange(1), default=RUNS, help='Cold and warm runs')
+@click.option('--mock', type=click.Path(file_okay=False), help='Serve the ecosystem resources from a directory')
+@click.option('--record', is_flag=True, default=False, help='Keep resources missing in the mock directory')
+@click.option('--latency', type=float, default=0.0, help='Milliseconds the mock hosts take to answer')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True))
+@click.pass_context
+def bench_query(ctx, q, arg, incremental, ignore_cycles, fragment_cache, memory_cache, concurrency, host, port, runs,
+                mock, record, latency, output):
+    from agora.engine.utils import Semaphore
+
+    args = dict(map(lambda a: split_arg(a), arg))
+    cache = bench_cache(memory_cache)
+    set_concurrency(concurrency)
+
+    def run():
+        dgw = ctx.obj['gw'].data(q, cache=cache, lazy=False, host=host, port=port, base=BENCH_FRAGMENTS)
+        return dgw.query(q, incremental=incremental, stop_event=Semaphore(), scholar=fragment_cache,
+                         follow_cycles=not ignore_cycles, **args)
+
+    bench_runs(ctx, 'query', q, run, runs, 'rows', mock, record, latency, output, concurrency=concurrency,
+               fragment_cache=fragment_cache, incremental=incremental)
+
+
+@bench.command('fragment')
+@click.argument('q')
+@click.option('--arg', multiple=True)
+@click.option('--ignore-cycles', is_flag=True, default=False)
+@click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
+@click.option('--host', default='agora')
+@click.option('--port', default=80)
+@click.option('--runs', type=click.IntRange(1), default=RUNS, help='Cold and warm runs')
+@click.option('--mock', type=click.Path(file_okay=False), help='Serve the ecosystem resources from a directory')
+@click.option('--record', is_flag=True, default=False, help='Keep resources missing in the mock directory')
+@click.option('--latency', type=float, default=0.0, help='Milliseconds the mock hosts take to answer')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True))
+@click.pass_context
+def bench_fragment(ctx, q, arg, ignore_cycles, fragment_cache, memory_cache, concurrency, host, port, runs, mock,
+                   record, latency, output):
+    from agora.engine.utils import Semaphore
+
+    args = dict(map(lambda a: split_arg(a), arg))
+    cache = bench_cache(memory_cache)
+    set_concurrency(concurrency)
+
+    def run():
+        dgw = ctx.obj['gw'].data(q, cache=cache, lazy=False, host=host, port=port, base=BENCH_FRAGMENTS)
+        with dgw:
+            fragment = dgw.fragment(q, stop_event=Semaphore(), scholar=fragment_cache,
+                                    follow_cycles=not ignore_cycles, **args)
+            for quad in fragment['generator']:
+                yield quad
+
+    bench_runs(ctx, 'fragment', q, run, runs, 'triples', mock, record, latency, output, concurrency=concurrency,
+               fragment_cache=fragment_cache)
+
+
+@bench.command('gql')
+@click.argument('q')
+@click.option('--schema-file', type=click.Path(exists=True))
+@click.option('--ignore-cycles', is_flag=True, default=False)
+@click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
+@click.option('--host', default='agora')
+@click.option('--port', default=80)
+@click.option('--runs', type=click.IntRange(1), default=RUNS, help='Cold and warm runs')
+@click.option('--mock', type=click.Path(file_okay=False), help='Serve the ecosystem resources from a directory')
+@click.option('--record', is_flag=True, default=False, help='Keep resources missing in the mock directory')
+@click.option('--latency', type=float, default=0.0, help='Milliseconds the mock hosts take to answer')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True))
+@click.pass_context
+def bench_gql(ctx, q, schema_file, ignore_cycles, fragment_cache, memory_cache, concurrency, host, port, runs, mock,
+              record, latency, output):
+    from agora_graphql.gql import GraphQLProcessor
+
+    q = q.replace("'", '"')
+    cache = bench_cache(memory_cache)
+    set_concurrency(concurrency)
+    ctx.obj['gw'].data_cache = cache
+    processor = GraphQLProcessor(ctx.obj['gw'], schema_path=schema_file, scholar=fragment_cache, host=host,
+                                 port=port, follow_cycles=not ignore_cycles, base=BENCH_FRAGMENTS)
+
+    def run():
+        res = processor.query(q)
+        if res.errors:
+            raise ValueError('; '.join([str(e) for e in res.errors]))
+        yield res
+
+    bench_runs(ctx, 'gql', q, run, runs, None, mock, record, latency, output, concurrency=concurrency,
+               fragment_cache=fragment_cache)
+
+
+@bench.command('generate')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--things', type=click.IntRange(1), default=1000, help='Root Thing Descriptions')
+@click.option('--types', type=click.IntRange(1), default=3, help='Types, each linking the next one')
+@click.option('--properties', type=click.IntRange(1), default=4, help='Literal properties per type')
+@click.option('--fanout', type=click.IntRange(1), default=10, help='Resources linked by every resource')
+@click.option('--hosts', type=click.IntRange(1), default=4)
+@click.option('--namespace', default=NAMESPACE)
+@click.pass_context
+def bench_generate(ctx, directory, things, types, properties, fanout, hosts, namespace):
+    synthetic = Synthetic(things=things, types=types, properties=properties, fanout=fanout, hosts=hosts,
+                          namespace=namespace)
+    if not path.isdir(directory):
+        os.makedirs(directory)
+
+    files = dict([(name, path.join(directory, name)) for name in ['extension.ttl', 'ted.ttl', 'queries.sparql']])
+    with open(files['extension.ttl'], 'w') as f:
+        synthetic.write_extension(f)
+    with open(files['ted.ttl'], 'w') as f:
+        synthetic.write_ted(f)
+    queries = synthetic.queries()
+    with open(files['queries.sparql'], 'w') as f:
+        f.write('\n\n'.join(queries) + '\n')
+    synthetic.dump(path.join(directory, SPEC_FILE))
+
+    click.echo(jsonify({
+        'descriptions': things + types - 1,
+        'resources': synthetic.resources,
+        'hosts': synthetic.bases,
+        'files': files,
+        'usage': [
+            'agora learn extension {} {}'.format(PREFIX, files['extension.ttl']),
+            'agora learn descriptions {}'.format(files['ted.ttl']),
+            "agora bench query --mock {} '{}'".format(directory, queries[-1].replace('\n', ' ')),
+            'agora bench serve {} --replace'.format(directory)
+        ]
+    }))
+
+
+@bench.command('serve')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', type=int, default=8090)
+@click.option('--record', is_flag=True, default=False, help='Keep resources missing in the directory')
+@click.option('--latency', type=float, default=0.0, help='Milliseconds the mock hosts take to answer')
+@click.option('--replace', is_flag=True, default=False,
+              help='Replace the served hosts with the server while it runs')
+@click.pass_context
+def bench_serve(ctx, directory, host, port, record, latency, replace):
+    from agora_cli.mock import MockServer
+
+    server = MockServer(directory, record=record, latency=latency / 1000.0, address=(host, port))
+    repls = ctx.obj['repls']
+    replaced = {}
+    if replace:
+        for base in server.source.bases:
+            if base not in repls:
+                replaced[base] = mock_uri(server.base, base)
+        repls.update(replaced)
+        store_host_replacements(repls)
+
+    click.echo(jsonify({'base': server.base, 'hosts': server.source.bases, 'replaced': sorted(replaced)}))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if replaced:
+            for base in replaced:
+                repls.pop(base, None)
+            store_host_replacements(repls)
+        click.echo(jsonify(server.stats))
@@ -0,0 +1,719 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import math
+import os
+import re
+import shutil
+import socket
+import time
+from Queue import Queue, Empty
+from StringIO import StringIO
+from collections import OrderedDict
+from itertools import islice
+from threading import Lock, Thread
+
+import click
+
+from agora_cli.codec import CODEC_KEY, CodecRedis, load_codec, store_codec
+from agora_cli.root import cli
+from agora_cli.timing import timings, timed, phase
+from agora_cli.utils import check_init, jsonify, split_arg
+
+__author__ = 'Fernando Serena'
+
+MEMORY_CACHE_SIZE = 1 << 26
+# Seconds that resources without caching headers are kept, as in RedisCache
+MIN_CACHE_TIME = 5
+# Links of a resource that are looked up at once in Redis when it is crawled
+PREFETCH_SIZE = 256
+CACHE_KEY = ':cache'
+GIDS_KEY = '{}:gids'.format(CACHE_KEY)
+STATS_KEY = 'cli:stats'
+STATS_INTERVAL = 10
+TTL_BUCKETS = [(60, '<1m'), (600, '<10m'), (3600, '<1h'), (86400, '<1d')]
+# Short uuids (resource and fragment ids), digests and numbers in keys
+VARIABLE_PART = re.compile(r'^([0-9A-Za-z]{22}|[0-9a-f]{40}|\d+)$')
+
+LOOKUP = """
+local uuid = redis.call('HGET', KEYS[1], ARGV[1])
+if uuid then
+    local value = redis.call('HMGET', ARGV[2] .. ':' .. uuid, 'data', 'ttl')
+    return {uuid, value[1], value[2]}
+end
+"""
+
+caches = {}
+
+
+def graph_size(g):
+    return sum([len(s) + len(p) + len(o) for s, p, o in g])
+
+
+class MemoryCache(object):
+    """
+    Resource cache in front of a RedisCache. Graphs are kept in the same Redis layout, with their data encoded by the
+    codec configured in the kv, and the fresh ones also in an in-process LRU bounded by the (estimated) size in bytes
+    of their terms (none if size is 0), so they are served without locking or reading their TTL in Redis. Conjunctive
+    graphs, locks and expiration are left to the RedisCache.
+    """
+
+    def __init__(self, cache, size=MEMORY_CACHE_SIZE):
+        self.cache = cache
+        self.size = size
+        self.codec = load_codec(cache.r)
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.loaded_bytes = 0
+        self.prefetched = 0
+        self.__r = CodecRedis(cache.r, self.codec) if self.codec.version else cache.r
+        self.__script = cache.r.register_script(LOOKUP)
+        self.__graphs = OrderedDict()
+        # Prefetched resources whose links are prefetched when they are first used
+        self.__unexpanded = set()
+        self.__bytes = 0
+        self.__lock = Lock()
+        self.__stats_key = '{}:{}:{}'.format(STATS_KEY, socket.gethostname(), os.getpid())
+        self.__published = time.time()
+
+    def __getattr__(self, item):
+        return getattr(self.cache, item)
+
+    @property
+    def r(self):
+        return self.__r
+
+    def __forget(self, gid):
+        entry = self.__graphs.pop(gid, None)
+        if entry is not None:
+            self.__bytes -= entry[2]
+        return entry
+
+    def __evict(self, gid):
+        self.__forget(gid)
+        self.__unexpanded.discard(gid)
+
+    def __memoize(self, gid, g, expires):
+        size = graph_size(g)
+        if not self.size or size > self.size:
+            return
+
+        with self.__lock:
+            self.__forget(gid)
+            while self.__graphs and self.__bytes + size > self.size:
+                self.__evict(next(iter(self.__graphs)))
+            self.__graphs[gid] = (g, expires, size)
+            self.__bytes += size
+
+    def __lookup(self, gid):
+        # Reads the uuid, cached data and TTL of a resource without taking its lock, in one round trip
+        gid_uuid, data, ttl_ts = self.__script(keys=[GIDS_KEY], args=[gid, CACHE_KEY]) or (None, None, None)
+        return gid_uuid, data, int(ttl_ts) if data is not None and ttl_ts is not None else 0
+
+    @timed('parsing')
+    def __parse(self, gid, data):
+        from rdflib import Graph
+
+        g = Graph(identifier=gid)
+        g.parse(StringIO(self.codec.decode(data)), format='turtle')
+        return g
+
+    def __load(self, gid, loader, format):
+        from agora.collector.execution import parse_rdf
+        from agora.collector.http import http_get, extract_ttl
+        from rdflib import Graph
+        from shortuuid import uuid
+
+        start = time.time()
+        _, data, ttl_ts = self.__lookup(gid)
+        if ttl_ts > time.time():
+            timings.add('cache_hits', time.time() - start)
+            return self.__parse(gid, data), ttl_ts - int(time.time())
+
+        r = self.cache.r
+        with self.cache.uri_lock(gid):
+            # It may have been loaded by someone else while waiting for the lock
+            gid_uuid, data, ttl_ts = self.__lookup(gid)
+            if ttl_ts > time.time():
+                timings.add('cache_hits', time.time() - start)
+                return self.__parse(gid, data), ttl_ts - int(time.time())
+
+            response = loader(gid, format)
+            if response is None and loader != http_get:
+                response = http_get(gid, format)
+            if isinstance(response, bool):
+                return response
+
+            g = Graph(identifier=gid)
+            source, headers = response
+            if not isinstance(source, Graph):
+                with phase('parsing'):
+                    parse_rdf(g, source, format, headers)
+                data = g.serialize(format='turtle')
+            else:
+                data = source.serialize(format='turtle')
+                for prefix, ns in source.namespaces():
+                    g.bind(prefix, ns)
+                g.__iadd__(source)
+            self.loads += 1
+            self.loaded_bytes += len(data)
+
+            ttl = extract_ttl(headers) or MIN_CACHE_TIME
+            gid_uuid = gid_uuid or uuid()
+            gid_key = '{}:{}'.format(CACHE_KEY, gid_uuid)
+            with r.pipeline() as p:
+                p.hset(GIDS_KEY, gid, gid_uuid)
+                p.hmset(gid_key, {'data': self.codec.encode(data), 'ttl': int(time.time()) + ttl})
+                p.expire(gid_key, max(ttl, 1))
+                p.execute()
+            return g, ttl
+
+    def prefetch(self, gids):
+        """
+        Brings the fresh resources among gids from Redis into memory, in two round trips for all of them.
+        """
+        with self.__lock:
+            gids = [gid for gid in set(gids) if gid not in self.__graphs]
+        if not self.size or not gids:
+            return 0
+
+        r = self.cache.r
+        cached = [(gid, gid_uuid) for gid, gid_uuid in zip(gids, r.hmget(GIDS_KEY, gids)) if gid_uuid]
+        with r.pipeline(transaction=False) as p:
+            for _, gid_uuid in cached:
+                p.hmget('{}:{}'.format(CACHE_KEY, gid_uuid), 'data', 'ttl')
+            values = p.execute()
+
+        now = time.time()
+        prefetched = 0
+        for (gid, _), (data, ttl_ts) in zip(cached, values):
+            if data is not None and ttl_ts is not None and int(ttl_ts) > now:
+                self.__memoize(gid, self.__parse(gid, data), int(ttl_ts))
+                self.__unexpanded.add(gid)
+                prefetched += 1
+        self.prefetched += prefetched
+        return prefetched
+
+    def __prefetch_links(self, g):
+        # The next crawl step dereferences the resources this one links to
+        from rdflib import URIRef
+
+        links = set([o for o in g.objects() if isinstance(o, URIRef)])
+        links.discard(g.identifier)
+        if links:
+            self.prefetch(list(islice(links, PREFETCH_SIZE)))
+
+    def create(self, conjunctive=False, gid=None, loader=None, format=None):
+        if conjunctive:
+            return self.cache.create(conjunctive=True)
+
+        now = time.time()
+        if now - self.__published >= STATS_INTERVAL:
+            self.publish()
+
+        with self.__lock:
+            entry = self.__forget(gid)
+            if entry is not None and entry[1] > now:
+                self.__graphs[gid] = entry
+                self.__bytes += entry[2]
+                self.hits += 1
+                expand = gid in self.__unexpanded
+                self.__unexpanded.discard(gid)
+            else:
+                expand = None
+                self.misses += 1
+
+        if expand is not None:
+            timings.add('cache_hits', time.time() - now)
+            if expand:
+                self.__prefetch_links(entry[0])
+            return entry[0], int(math.ceil(entry[1] - now))
+
+        res = self.__load(gid, loader, format)
+        if isinstance(res, tuple):
+            g, ttl = res
+            if ttl > 0:
+                self.__memoize(gid, g, now + ttl)
+            if self.size:
+                self.__prefetch_links(g)
+        return res
+
+    def expire(self, gid):
+        with self.__lock:
+            self.__evict(gid)
+        self.cache.expire(gid)
+
+    def clear(self):
+        with self.__lock:
+            self.__graphs.clear()
+            self.__unexpanded.clear()
+            self.__bytes = 0
+
+    @property
+    def stats(self):
+        with self.__lock:
+            return {
+                'compression': self.codec.stats['ratio'] or 0,
+                'size': self.size,
+                'bytes': self.__bytes,
+                'entries': len(self.__graphs),
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'prefetched': self.prefetched,
+                'loaded_bytes': self.loaded_bytes
+            }
+
+    def publish(self):
+        # Long-running processes (daemon, publish servers) leave their live stats in the kv for 'show cache'
+        self.__published = time.time()
+        try:
+            with self.cache.r.pipeline() as p:
+                p.hmset(self.__stats_key, self.stats)
+                p.expire(self.__stats_key, 3 * STATS_INTERVAL)
+                p.execute()
+        except Exception:
+            pass
+
+
+def cache_settings(cache_file=None, cache_host=None, cache_port=None, cache_db=None):
+    cache_base = '.agora/store'
+    if cache_file:
+        path_parts = cache_file.split('/')
+        cache_base = '/'.join(path_parts[:-1])
+        cache_file = path_parts[-1]
+
+    remote_cache = all([cache_host, cache_port, cache_db])
+    return {
+        'redis_file': None if remote_cache else (cache_file or 'data.db'),
+        'base': cache_base,
+        'path': '',
+        'redis_host': cache_host,
+        'redis_db': cache_db,
+        'redis_port': cache_port
+    }
+
+
+def get_cache(cache_file=None, cache_host=None, cache_port=None, cache_db=None, memory_size=MEMORY_CACHE_SIZE):
+    """
+    Returns the resource cache for the given settings, built only once per process, with an in-process tier of
+    memory_size bytes.
+    """
+    key = (cache_file, cache_host, cache_port, cache_db, memory_size)
+    if key not in caches:
+        from agora import RedisCache
+
+        cache = RedisCache(**cache_settings(cache_file, cache_host, cache_port, cache_db))
+        caches[key] = MemoryCache(cache, size=memory_size)
+    return caches[key]
+
+
+def get_cache_kv(cache_file=None, cache_host=None, cache_port=None, cache_db=None):
+    """
+    Opens the key-value store behind a resource cache without building the cache, which would purge its locks.
+    """
+    from agora.engine.utils.kv import get_kv
+
+    return get_kv(**cache_settings(cache_file, cache_host, cache_port, cache_db))
+
+
+def flush_cache(kv, batch=1000):
+    """
+    Deletes everything kept in kv but its codec settings and dictionaries, which values encoded from now on and
+    other processes still use.
+    """
+    keys = [key for key in kv.scan_iter(count=batch) if not key.startswith(CODEC_KEY)]
+    for i in range(0, len(keys), batch):
+        kv.delete(*keys[i:i + batch])
+    return len(keys)
+
+
+def clear_memory():
+    for cache in caches.values():
+        cache.clear()
+
+
+def key_namespace(key):
+    parts = key.split(':')
+    ns = []
+    for i, part in enumerate(parts):
+        if part == 'l' and i < len(parts) - 1:
+            # Lock keys end with the locked URI
+            ns.append('l:*')
+            break
+        ns.append('*' if VARIABLE_PART.match(part) else part)
+    return ':'.join(ns)
+
+
+def ttl_bucket(ttl):
+    if ttl < 0:
+        return 'persistent'
+    for limit, label in TTL_BUCKETS:
+        if ttl < limit:
+            return label
+    return '>=1d'
+
+
+def keys_memory(kv, keys):
+    with kv.pipeline(transaction=False) as p:
+        for key in keys:
+            p.execute_command('MEMORY', 'USAGE', key)
+        sizes = p.execute(raise_on_error=False)
+
+    memory = []
+    for key, size in zip(keys, sizes):
+        if isinstance(size, Exception):
+            # Redis < 4 has no MEMORY USAGE
+            size = kv.debug_object(key).get('serializedlength')
+        memory.append(size or 0)
+    return memory
+
+
+def inspect_kv(kv, batch=1000):
+    namespaces = {}
+    ttls = {}
+    keys = []
+    for key in kv.scan_iter(count=batch):
+        keys.append(key)
+        if len(keys) == batch:
+            _inspect_keys(kv, keys, namespaces, ttls)
+            keys = []
+    _inspect_keys(kv, keys, namespaces, ttls)
+
+    return {
+        'keys': sum([ns['keys'] for ns in namespaces.values()]),
+        'memory': sum([ns['memory'] for ns in namespaces.values()]),
+        'namespaces': namespaces,
+        'ttl': ttls
+    }
+
+
+def _inspect_keys(kv, keys, namespaces, ttls):
+    if not keys:
+        return
+
+    with kv.pipeline(transaction=False) as p:
+        for key in keys:
+            p.ttl(key)
+        key_ttls = p.execute()
+
+    for key, ttl, memory in zip(keys, key_ttls, keys_memory(kv, keys)):
+        if ttl is None or ttl == -2:
+            continue
+        ns = namespaces.setdefault(key_namespace(key), {'keys': 0, 'memory': 0})
+        ns['keys'] += 1
+        ns['memory'] += memory
+        bucket = ttl_bucket(ttl)
+        ttls[bucket] = ttls.get(bucket, 0) + 1
+
+
+def inspect_compression(kv, sample=100):
+    codec = load_codec(kv)
+    report = {'level': codec.level, 'dictionary': codec.version, 'sampled': 0, 'raw': 0, 'stored': 0}
+    for _, gid_uuid in islice(kv.hscan_iter(GIDS_KEY), sample):
+        data = kv.hget('{}:{}'.format(CACHE_KEY, gid_uuid), 'data')
+        if data is not None:
+            report['sampled'] += 1
+            report['stored'] += len(data)
+            report['raw'] += len(codec.decode(data))
+    report['ratio'] = round(report['raw'] / float(report['stored']), 3) if report['stored'] else None
+    return report
+
+
+def live_stats(kv):
+    stats = {}
+    for key in kv.scan_iter(match='{}:*'.format(STATS_KEY)):
+        node = dict([(k, int(v)) for k, v in kv.hgetall(key).items()])
+        lookups = node.get('hits', 0) + node.get('misses', 0)
+        if lookups:
+            node['memory_hit_ratio'] = node.get('hits', 0) / float(lookups)
+            node['hit_ratio'] = 1.0 - node.get('loads', 0) / float(lookups)
+        stats[key[len(STATS_KEY) + 1:]] = node
+    return stats
+
+
+def inspect_fragments(base='.agora/store/fragments', top=10):
+    from rdflib import ConjunctiveGraph
+
+    report = {'contexts': 0, 'triples': 0, 'disk': 0}
+    if not os.path.isdir(base):
+        return report
+
+    report['disk'] = sum([os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(base) for f in files])
+
+    # Opened read-only: get_triple_store removes stores it fails to open
+    g = ConjunctiveGraph('Sleepycat')
+    try:
+        g.open(base, create=False)
+    except Exception as e:
+        report['error'] = str(e)
+        return report
+
+    try:
+        sizes = sorted([(c.identifier, len(c)) for c in g.contexts()], key=lambda x: x[1], reverse=True)
+    finally:
+        g.close()
+
+    report['contexts'] = len(sizes)
+    report['triples'] = sum([n for _, n in sizes])
+    report['largest'] = [{'context': unicode(c), 'triples': n} for c, n in sizes[:top]]
+    return report
+
+
+def evict_resources(kv, prefixes=None, idle=None, max_size=None, batch=1000):
+    """
+    Evicts the cached resources whose URI starts with any of the given prefixes and that have not been used for
+    idle seconds (when given), and then the least recently used ones until the rest fit in max_size bytes.
+    """
+    filtered = prefixes is not None or idle is not None
+    gids = kv.hgetall(GIDS_KEY).items()
+    if prefixes is not None:
+        prefixes = tuple(prefixes)
+
+    resources = []
+    for i in range(0, len(gids), batch):
+        chunk = gids[i:i + batch]
+        keys = ['{}:{}'.format(CACHE_KEY, uuid) for _, uuid in chunk]
+        with kv.pipeline(transaction=False) as p:
+            for key in keys:
+                p.object('idletime', key)
+            idle_times = p.execute()
+        resources.extend(zip([gid for gid, _ in chunk], keys, idle_times, keys_memory(kv, keys)))
+
+    # Least recently used first; resources whose data already expired go always
+    resources.sort(key=lambda r: r[2], reverse=True)
+    evicted = []
+    kept = []
+    for resource in resources:
+        gid, _, idle_time, _ = resource
+        if idle_time is None or (filtered and (prefixes is None or gid.startswith(prefixes)) and (
+                idle is None or idle_time >= idle)):
+            evicted.append(resource)
+        else:
+            kept.append(resource)
+
+    if max_size is not None:
+        size = sum([r[3] for r in kept])
+        while kept and size > max_size:
+            resource = kept.pop(0)
+            size -= resource[3]
+            evicted.append(resource)
+
+    for i in range(0, len(evicted), batch):
+        with kv.pipeline() as p:
+            for gid, key, _, _ in evicted[i:i + batch]:
+                p.hdel(GIDS_KEY, gid)
+                p.delete(key)
+            p.execute()
+
+    return {'resources': len(evicted), 'bytes': sum([r[3] for r in evicted])}
+
+
+def fragment_age(kv, key):
+    # Fragments keep their TTL in 'updated', which expires with it
+    with kv.pipeline(transaction=False) as p:
+        p.get('{}:updated'.format(key))
+        p.ttl('{}:updated'.format(key))
+        ttl, remaining = p.execute()
+    if ttl is None or remaining is None or remaining < 0:
+        return None
+    return int(ttl) - remaining
+
+
+def evict_fragments(kv, fids=None, older_than=None, base='.agora/store/fragments'):
+    """
+    Evicts the given fragments (all when None) that were last updated more than older_than seconds ago (when
+    given), both from the kv and the fragments store.
+    """
+    evicted = set()
+    for fragments_key in kv.scan_iter(match='*:fragments'):
+        for fid in kv.smembers(fragments_key):
+            if fids is not None and fid not in fids:
+                continue
+            key = '{}:{}'.format(fragments_key, fid)
+            if older_than is not None:
+                age = fragment_age(kv, key)
+                if age is not None and age < older_than:
+                    continue
+
+            with kv.pipeline() as p:
+                p.srem(fragments_key, fid)
+                p.srem('{}:orph'.format(fragments_key), fid)
+                for fragment_key in kv.scan_iter(match='{}*'.format(key)):
+                    p.delete(fragment_key)
+                p.execute()
+            evicted.add(fid)
+
+    remove_fragment_contexts(evicted, base=base)
+    return {'fragments': len(evicted)}
+
+
+def remove_fragment_contexts(fids, base='.agora/store/fragments'):
+    from rdflib import ConjunctiveGraph
+
+    if not fids or not os.path.isdir(base):
+        return
+
+    g = ConjunctiveGraph('Sleepycat')
+    g.open(base, create=False)
+    try:
+        # Contexts are named after (fid, triple pattern)
+        for c in [c for c in g.contexts() if any([fid in c.identifier for fid in fids])]:
+            g.remove_context(c)
+    finally:
+        g.close()
+
+
+def clear_fragments(base='.agora/store/fragments'):
+    shutil.rmtree(base, ignore_errors=True)
+
+
+def read_queries(query_file):
+    # Queries in a file are separated by blank lines
+    with open(query_file) as f:
+        return filter(lambda q: q, [q.strip() for q in re.split(r'\n\s*\n', f.read())])
+
+
+def warm_thread(queries, dgws, results, ignore_cycles, args):
+    from agora.engine.utils import Semaphore
+
+    while True:
+        try:
+            q = queries.get_nowait()
+        except Empty:
+            return
+
+        dgw = dgws[q]
+        try:
+            with dgw:
+                fragment = dgw.fragment(q, stop_event=Semaphore(), scholar=True, follow_cycles=not ignore_cycles,
+                                        **args)
+                results[q] = sum([1 for _ in fragment['generator']])
+        except Exception as e:
+            results[q] = e
+
+
+@cli.group('cache')
+@click.pass_context
+def _cache(ctx):
+    check_init(ctx)
+
+
+@_cache.command('warm')
+@click.option('--query', multiple=True)
+@click.option('--query-file', type=click.Path(exists=True))
+@click.option('--arg', multiple=True)
+@click.option('--ignore-cycles', is_flag=True, default=False)
+@click.option('--cache-file')
+@click.option('--cache-host')
+@click.option('--cache-port')
+@click.option('--cache-db')
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=4)
+@click.option('--host', default='agora')
+@click.option('--port', default=80)
+@click.pass_context
+def warm(ctx, query, query_file, arg, ignore_cycles, cache_file, cache_host, cache_port, cache_db, memory_cache,
+         concurrency, host, port):
+    args = dict(map(lambda a: split_arg(a), arg))
+    queries = list(query)
+    if query_file:
+        queries.extend(read_queries(query_file))
+    if not queries:
+        raise click.UsageError('No query to warm the cache with')
+
+    from agora_cli.hosts import get_hosts
+    from agora_cli.loader import set_concurrency
+
+    cache = get_cache(cache_file, cache_host, cache_port, cache_db, memory_size=memory_cache)
+    before = cache.stats
+    set_concurrency(concurrency)
+
+    # Ecosystems are discovered one at a time, only crawls run concurrently
+    gw = ctx.obj['gw']
+    dgws = {}
+    for q in queries:
+        dgws[q] = gw.data(q, cache=cache, lazy=False, host=host, port=port, base='.agora/store/fragments')
+
+    pending = Queue()
+    for q in dgws:
+        pending.put(q)
+
+    results = {}
+    start = time.time()
+    threads = [Thread(target=warm_thread, args=(pending, dgws, results, ignore_cycles, args))
+               for _ in range(max(1, min(concurrency, len(dgws))))]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.time() - start
+
+    errors = dict([(q, str(res)) for q, res in results.items() if isinstance(res, Exception)])
+    report = {
+        'queries': len(dgws),
+        'triples': sum([res for res in results.values() if not isinstance(res, Exception)]),
+        'elapsed': round(elapsed, 3)
+    }
+    after = cache.stats
+    report['resources'] = after['loads'] - before['loads']
+    report['bytes'] = after['loaded_bytes'] - before['loaded_bytes']
+    report['resources_per_second'] = round(report['resources'] / elapsed, 2) if elapsed else None
+    report['hosts'] = get_hosts().stats
+    if errors:
+        report['errors'] = errors
+    click.echo(jsonify(report))
+
+
+@_cache.command('compression')
+@click.option('--cache-file')
+@click.option('--cache-host')
+@click.option('--cache-port')
+@click.option('--cache-db')
+@click.option('--level', type=click.IntRange(0, 9))
+@click.option('--dictionary-file', type=click.Path(exists=True))
+@click.option('--prefixes', is_flag=True, default=False)
+@click.option('--no-dictionary', is_flag=True, default=False)
+@click.pass_context
+def compression(ctx, cache_file, cache_host, cache_port, cache_db, level, dictionary_file, prefixes, no_dictionary):
+    kv = get_cache_kv(cache_file, cache_host, cache_port, cache_db)
+    dictionary = None
+    if no_dictionary:
+        dictionary = []
+    elif prefixes or dictionary_file:
+        dictionary = []
+        if prefixes:
+            dictionary.extend(sorted(ctx.obj['gw'].agora.fountain.prefixes.values()))
+        if dictionary_file:
+            with open(dictionary_file) as f:
+                dictionary.extend([line.strip() for line in f])
+
+    try:
+        codec = store_codec(kv, level=level, dictionary=dictionary)
+    except ValueError as e:
+        raise click.BadParameter(e.message)
+
+    if dictionary is not None:
+        click.echo('Fragments collected with the previous dictionary should be evicted (delete cache --fragment)',
+                   err=True)
+    click.echo(jsonify({
+        'level': codec.level,
+        'dictionary': codec.version,
+        'entries': len(codec.dictionary(codec.version)) if codec.version else 0
+    }))
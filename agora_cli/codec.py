@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import json
+import re
+import struct
+import time
+import zlib
+
+from redis import StrictRedis
+from redis.client import StrictPipeline
+
+__author__ = 'Fernando Serena'
+
+CODEC_KEY = 'cli:codec'
+COMPRESSION_LEVEL = 6
+MAX_DICTIONARY = 255
+
+# Encoded values start with a marker, the version of the dictionary they were encoded with and a checksum of its
+# entries. Neither zlib streams nor the members of fragment streams can start with these markers.
+SUBSTITUTED, DEFLATED = '\x00', '\x01'
+ESCAPE = '\x02'
+EXPANSION = re.compile(ESCAPE + '(.)', re.S)
+
+
+def utf8(value):
+    return value.encode('utf-8') if isinstance(value, unicode) else str(value)
+
+
+def checksum(dictionary):
+    return struct.pack('!H', zlib.crc32('\n'.join(dictionary)) & 0xffff)
+
+
+class Codec(object):
+    """
+    Encodes cache values with zlib at the configured level. Python 2's zlib has no preset dictionaries, so the
+    shared dictionary is a list of strings (typically namespace URIs) that are replaced by two-byte escapes before
+    deflating. Dictionaries are versioned in the kv, so values encoded with a previous one can still be decoded
+    until its version is taken by a new dictionary (versions wrap around after 255); then decoding them fails, as the
+    checksum in their header no longer matches.
+    """
+
+    def __init__(self, kv=None, level=COMPRESSION_LEVEL, version=0, dictionary=None):
+        self.kv = kv
+        self.level = level
+        self.version = version
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+        self.encode_time = 0.0
+        self.decode_time = 0.0
+        self.__dictionaries = {}
+        self.__checksums = {}
+        self.__substitution = None
+        if version:
+            self.__dictionaries[version] = map(utf8, dictionary or [])
+            self.__checksums[version] = checksum(self.__dictionaries[version])
+            entries = sorted(self.__dictionaries[version], key=len, reverse=True)
+            index = dict([(e, ESCAPE + chr(i + 1)) for i, e in enumerate(self.__dictionaries[version])])
+            pattern = re.compile('|'.join(map(re.escape, entries)))
+            self.__substitution = lambda data: pattern.sub(lambda m: index[m.group(0)], data)
+
+    def dictionary(self, version):
+        if version not in self.__dictionaries:
+            entries = self.kv.get('{}:dict:{}'.format(CODEC_KEY, version)) if self.kv is not None else None
+            if entries is None:
+                raise ValueError('Unknown cache dictionary: {}'.format(version))
+            self.__dictionaries[version] = map(utf8, json.loads(entries))
+            self.__checksums[version] = checksum(self.__dictionaries[version])
+        return self.__dictionaries[version]
+
+    def __substitute(self, data):
+        return self.__substitution(data.replace(ESCAPE, ESCAPE + '\x00'))
+
+    def __expand(self, data, version, digest):
+        dictionary = self.dictionary(version)
+        if self.__checksums[version] != digest:
+            raise ValueError('Cache dictionary {} was replaced after the value was encoded'.format(version))
+        return EXPANSION.sub(lambda m: ESCAPE if m.group(1) == '\x00' else dictionary[ord(m.group(1)) - 1], data)
+
+    def __encode(self, data, raw=False):
+        start = time.time()
+        if self.__substitution is None:
+            value = data if raw else zlib.compress(data, self.level)
+        else:
+            sub = self.__substitute(data)
+            header = chr(self.version) + self.__checksums[self.version]
+            candidates = [SUBSTITUTED + header + sub, DEFLATED + header + zlib.compress(sub, self.level)]
+            if raw:
+                candidates.append(data)
+            value = min(candidates, key=len)
+
+        self.encode_time += time.time() - start
+        self.raw_bytes += len(data)
+        self.encoded_bytes += len(value)
+        return value
+
+    def __decode(self, value, raw=False):
+        start = time.time()
+        marker = value[:1]
+        if marker == SUBSTITUTED:
+            data = self.__expand(value[4:], ord(value[1]), value[2:4])
+        elif marker == DEFLATED:
+            data = self.__expand(zlib.decompress(value[4:]), ord(value[1]), value[2:4])
+        else:
+            data = value if raw else zlib.decompress(value)
+        self.decode_time += time.time() - start
+        return data
+
+    def encode(self, data):
+        """
+        Encodes a resource; without a dictionary it is a plain zlib stream, as RedisCache stores them.
+        """
+        return self.__encode(utf8(data))
+
+    def decode(self, value):
+        return self.__decode(value)
+
+    def encode_member(self, member):
+        """
+        Encodes a member of a fragment stream. Members are short, so they are only encoded with a dictionary and
+        may stay as they are. Encoding is deterministic, as members are looked up by value.
+        """
+        return self.__encode(utf8(member), raw=True)
+
+    def decode_member(self, value):
+        return self.__decode(value, raw=True)
+
+    @property
+    def stats(self):
+        return {
+            'level': self.level,
+            'dictionary': self.version,
+            'raw_bytes': self.raw_bytes,
+            'encoded_bytes': self.encoded_bytes,
+            'ratio': round(self.raw_bytes / float(self.encoded_bytes), 3) if self.encoded_bytes else None,
+            'encode_time': round(self.encode_time, 3),
+            'decode_time': round(self.decode_time, 3)
+        }
+
+
+def load_codec(kv):
+    settings = kv.hgetall(CODEC_KEY)
+    version = int(settings.get('version', 0))
+    dictionary = json.loads(kv.get('{}:dict:{}'.format(CODEC_KEY, version)) or '[]') if version else None
+    return Codec(kv, level=int(settings.get('level', COMPRESSION_LEVEL)), version=version, dictionary=dictionary)
+
+
+def store_codec(kv, level=None, dictionary=None):
+    """
+    Changes the codec settings kept in kv. A new dictionary gets the next version, wrapping around after 255 (values
+    still encoded with the dictionary it replaces can no longer be decoded); an empty one disables substitution.
+    """
+    settings = kv.hgetall(CODEC_KEY)
+    if level is not None:
+        settings['level'] = level
+    if dictionary is not None:
+        dictionary = filter(None, dictionary)
+        if len(dictionary) > MAX_DICTIONARY:
+            raise ValueError('Cache dictionaries hold up to {} entries'.format(MAX_DICTIONARY))
+        version = 0
+        if dictionary:
+            version = int(settings.get('version', 0)) % MAX_DICTIONARY + 1
+            kv.set('{}:dict:{}'.format(CODEC_KEY, version), json.dumps(dictionary))
+        settings['version'] = version
+    if settings:
+        kv.hmset(CODEC_KEY, settings)
+    return load_codec(kv)
+
+
+STREAM_COMMANDS = {'ZADD', 'ZSCORE', 'ZREM', 'ZRANK'}
+
+
+def encode_args(codec, args):
+    command = args[0]
+    if command not in STREAM_COMMANDS or not str(args[1]).endswith(':stream'):
+        return args
+
+    args = list(args)
+    if command == 'ZADD':
+        members = range(3, len(args), 2)
+    else:
+        members = range(2, len(args))
+    for i in members:
+        args[i] = codec.encode_member(args[i])
+    return args
+
+
+class CodecPipeline(StrictPipeline):
+    def __init__(self, codec, *args, **kwargs):
+        super(CodecPipeline, self).__init__(*args, **kwargs)
+        self.codec = codec
+
+    def execute_command(self, *args, **kwargs):
+        return super(CodecPipeline, self).execute_command(*encode_args(self.codec, args), **kwargs)
+
+
+class CodecRedis(StrictRedis):
+    """
+    Client on the connection pool of kv that encodes the members of fragment streams (sorted sets under
+    '...:stream' keys) with codec.
+    """
+
+    def __init__(self, kv, codec):
+        super(CodecRedis, self).__init__(connection_pool=kv.connection_pool)
+        self.codec = codec
+
+    def execute_command(self, *args, **options):
+        res = super(CodecRedis, self).execute_command(*encode_args(self.codec, args), **options)
+        if args[0] == 'ZRANGEBYSCORE' and str(args[1]).endswith(':stream'):
+            if options.get('withscores'):
+                return [(self.codec.decode_member(m), s) for m, s in res]
+            return [self.codec.decode_member(m) for m in res]
+        return res
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return CodecPipeline(self.codec, self.connection_pool, self.response_callbacks, transaction, shard_hint)
@@ -20,8 +20,9 @@
 import click
 from agora_graphql.gql import GraphQLProcessor
 
+from agora_cli.paths import get_path_index
 from agora_cli.root import cli
-from agora_cli.utils import split_arg, check_init
+from agora_cli.utils import split_arg, check_init, jsonify, error
 
 __author__ = 'Fernando Serena'
 
@@ -50,3 +51,17 @@ def search_plan(ctx, query, arg):
 def show_gql_schema(ctx):
     processor = GraphQLProcessor(ctx.obj['gw'])
     click.echo(processor.schema_text)
+
+
+@compute.command('path-index')
+@click.option('--rebuild', is_flag=True, default=False, help='Search the paths of every type again')
+@click.pass_context
+def compute_path_index(ctx, rebuild):
+    from agora.engine.fountain import Fountain
+
+    fountain = ctx.obj['gw'].agora.fountain
+    fountain = getattr(fountain, 'indexed', fountain)
+    if not isinstance(fountain, Fountain):
+        error('Paths can only be indexed for a local fountain')
+        return
+    click.echo(jsonify(get_path_index().build(fountain, rebuild=rebuild)))
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import json
+import os
+import os.path as path
+import signal
+import socket
+import struct
+import sys
+import time
+import traceback
+from SocketServer import UnixStreamServer, StreamRequestHandler
+from datetime import datetime
+
+import click
+
+from agora_cli.root import cli, LazyGateway
+from agora_cli.utils import check_init, jsonify, error
+
+__author__ = 'Fernando Serena'
+
+SOCKET = '.agora/daemon.sock'
+PID = '.agora/daemon.pid'
+LOG = '.agora/daemon.log'
+
+# Commands that are transparently served by a running daemon
+FORWARDED = {'add', 'cache', 'compute', 'delete', 'discover', 'get', 'gql', 'learn', 'list', 'query', 'show'}
+
+# Commands that change the TED, so warm data gateways must be rebuilt
+MUTATING = {'add', 'delete', 'learn'}
+
+EXIT, STDOUT, STDERR = 0, 1, 2
+FRAME = struct.Struct('!BI')
+
+
+def send_frame(wfile, channel, data):
+    wfile.write(FRAME.pack(channel, len(data)) + data)
+
+
+def recv_exactly(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(n)
+        if not chunk:
+            raise EOFError
+        chunks.append(chunk)
+        n -= len(chunk)
+    return ''.join(chunks)
+
+
+def forward(args):
+    """
+    Runs a command in the daemon serving this Agora, if any, relaying its output. Returns the exit code, or None
+    when the command has to run locally.
+    """
+    if not args or args[0] not in FORWARDED or not path.exists(SOCKET):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET)
+    except socket.error:
+        sock.close()
+        return None
+
+    try:
+        sock.sendall(json.dumps({'op': 'run', 'args': list(args)}) + '\n')
+        while True:
+            channel, length = FRAME.unpack(recv_exactly(sock, FRAME.size))
+            data = recv_exactly(sock, length)
+            if channel == EXIT:
+                return int(data)
+            stream = sys.stdout if channel == STDOUT else sys.stderr
+            stream.write(data)
+            stream.flush()
+    except EOFError:
+        error('The daemon closed the connection')
+        return 1
+    finally:
+        sock.close()
+
+
+def request(op):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET)
+        sock.sendall(json.dumps({'op': op}) + '\n')
+        chunks = []
+        while True:
+            channel, length = FRAME.unpack(recv_exactly(sock, FRAME.size))
+            data = recv_exactly(sock, length)
+            if channel == EXIT:
+                return ''.join(chunks)
+            chunks.append(data)
+    finally:
+        sock.close()
+
+
+def is_running():
+    try:
+        request('ping')
+        return True
+    except (socket.error, EOFError):
+        return False
+
+
+class WarmDataGateway(object):
+    """
+    Data gateway shared by the requests of the daemon. Leaving a with block does not shut down its scholars, so
+    their fragment caches stay warm until the daemon resets its data gateways.
+    """
+
+    def __init__(self, dgw):
+        self.dgw = dgw
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __getattr__(self, item):
+        return getattr(self.dgw, item)
+
+
+class WarmGateway(LazyGateway):
+    """
+    Gateway kept by the daemon across requests. Data gateways are reused for the same query, cache and options, so
+    discovery and search planning are done once per query. Caches are built once per process for their settings
+    (see get_cache), so scholars never outlive the cache they were built with.
+    """
+
+    def __init__(self, config):
+        super(WarmGateway, self).__init__(config)
+        self.__data = {}
+
+    @property
+    def warm_queries(self):
+        return len(self.__data)
+
+    def data(self, query, cache=None, **kwargs):
+        key = (query, id(cache), tuple(sorted(kwargs.items())))
+        dgw = self.__data.get(key)
+        if dgw is None:
+            dgw = WarmDataGateway(super(WarmGateway, self).data(query, cache=cache, **kwargs))
+            self.__data[key] = dgw
+        else:
+            from agora_cli.loader import install_loader
+
+            install_loader(dgw.ted, cache.r if cache is not None else None)
+        return dgw
+
+    def reset(self):
+        for dgw in self.__data.values():
+            dgw.shutdown()
+        self.__data.clear()
+
+
+class FrameWriter(object):
+    """
+    File-like object that stands for stdout/stderr while a command runs in the daemon. Output is sent in frames
+    of at most buffer_size bytes, and at least every flush_interval seconds while the command keeps writing.
+    """
+
+    def __init__(self, wfile, channel, buffer_size=65536, flush_interval=0.2):
+        self.wfile = wfile
+        self.channel = channel
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.__buffer = []
+        self.__size = 0
+        self.__last = time.time()
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.__buffer.append(data)
+        self.__size += len(data)
+        if self.__size >= self.buffer_size:
+            self.send()
+
+    def flush(self):
+        if time.time() - self.__last >= self.flush_interval:
+            self.send()
+
+    def send(self):
+        if self.__size:
+            send_frame(self.wfile, self.channel, ''.join(self.__buffer))
+            self.__buffer = []
+            self.__size = 0
+        self.__last = time.time()
+
+    def isatty(self):
+        return False
+
+
+class DaemonRequestHandler(StreamRequestHandler):
+    def handle(self):
+        req = json.loads(self.rfile.readline())
+        op = req.get('op')
+        if op == 'run':
+            code = self.server.run(req['args'], self.wfile)
+        else:
+            if op == 'status':
+                send_frame(self.wfile, STDOUT, jsonify(self.server.status))
+            elif op == 'stop':
+                self.server.stopped = True
+            code = 0
+        send_frame(self.wfile, EXIT, str(code))
+
+
+class DaemonServer(UnixStreamServer):
+    """
+    Serves CLI invocations over a Unix socket, one at a time, with a warm gateway.
+    """
+    timeout = 1.0
+
+    def __init__(self, config):
+        UnixStreamServer.__init__(self, SOCKET, DaemonRequestHandler)
+        self.gw = WarmGateway(config)
+        self.started = datetime.now()
+        self.requests = 0
+        self.stopped = False
+
+    @property
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'started': self.started.isoformat(),
+            'uptime': (datetime.now() - self.started).total_seconds(),
+            'requests': self.requests,
+            'gateway': self.gw.loaded,
+            'warm_queries': self.gw.warm_queries
+        }
+
+    def run(self, args, wfile):
+        self.requests += 1
+        out, err = FrameWriter(wfile, STDOUT), FrameWriter(wfile, STDERR)
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = out, err
+        try:
+            try:
+                code = cli.main(args=args, prog_name='agora', standalone_mode=False, obj={'gw': self.gw})
+            except click.ClickException as e:
+                e.show()
+                code = e.exit_code
+            except click.Abort:
+                click.echo('Aborted!', err=True)
+                code = 1
+            except SystemExit as e:
+                code = e.code
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            finally:
+                if args[0] in MUTATING:
+                    self.gw.reset()
+            out.send()
+            err.send()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        return code if isinstance(code, int) else 0
+
+    def serve(self):
+        while not self.stopped:
+            self.handle_request()
+
+    def stop(self, *args):
+        self.stopped = True
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        self.gw.reset()
+        if self.gw.loaded:
+            from agora import Agora
+
+            self.gw.close()
+            Agora.close()
+        for p in [SOCKET, PID]:
+            if path.exists(p):
+                os.remove(p)
+
+
+def detach():
+    if os.fork():
+        os._exit(0)
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+
+    with open(os.devnull, 'r') as null:
+        os.dup2(null.fileno(), sys.stdin.fileno())
+    with open(LOG, 'a') as log:
+        os.dup2(log.fileno(), sys.stdout.fileno())
+        os.dup2(log.fileno(), sys.stderr.fileno())
+
+
+@cli.group()
+@click.pass_context
+def daemon(ctx):
+    check_init(ctx)
+
+
+@daemon.command('start')
+@click.option('--foreground', is_flag=True, default=False)
+@click.pass_context
+def daemon_start(ctx, foreground):
+    if is_running():
+        error('The daemon is already running')
+        return
+
+    if path.exists(SOCKET):
+        os.remove(SOCKET)
+
+    if not foreground:
+        click.echo('[ OK ] Agora daemon is starting')
+        detach()
+
+    server = DaemonServer(ctx.obj['config'])
+    with open(PID, 'w') as f:
+        f.write(str(os.getpid()))
+    signal.signal(signal.SIGTERM, server.stop)
+    signal.signal(signal.SIGINT, server.stop)
+    try:
+        server.serve()
+    finally:
+        server.server_close()
+
+
+@daemon.command('stop')
+@click.pass_context
+def daemon_stop(ctx):
+    if not is_running():
+        error('The daemon is not running')
+        return
+
+    request('stop')
+    while path.exists(SOCKET):
+        time.sleep(0.1)
+    click.echo('[ OK ] Agora daemon stopped')
+
+
+@daemon.command('status')
+@click.pass_context
+def daemon_status(ctx):
+    try:
+        click.echo(request('status'))
+    except (socket.error, EOFError):
+        error('The daemon is not running')
+        ctx.exit(1)
@@ -18,12 +18,9 @@
 """
 
 import click
-from agora import RedisCache
-from agora.engine.utils.graph import get_triple_store
-from agora_gw.gateway import NotFoundError, GatewayError
 
 from agora_cli.root import cli
-from agora_cli.utils import check_init, store_host_replacements, show_ted, error
+from agora_cli.utils import check_init, store_host_replacements, store_host_limits, show_ted, error, jsonify
 
 __author__ = 'Fernando Serena'
 
@@ -38,8 +35,13 @@ def delete(ctx):
 @click.pass_context
 @click.argument('name')
 def delete_extension(ctx, name):
+    from agora_cli.paths import update_path_index
+    from agora_cli.plans import invalidate_plans
+
     gw = ctx.obj['gw']
     gw.forget_extension(name)
+    invalidate_plans()
+    update_path_index(gw.agora.fountain)
 
 
 @delete.group('host')
@@ -57,25 +59,41 @@ def delete_host_replacement(ctx, base):
         store_host_replacements(ctx.obj['repls'])
 
 
+@delete_host.command('limit')
+@click.argument('host')
+@click.pass_context
+def delete_host_limit(ctx, host):
+    if host in ctx.obj['limits']:
+        del ctx.obj['limits'][host]
+        store_host_limits(ctx.obj['limits'])
+
+
 @delete.command('cache')
 @click.pass_context
 @click.option('--cache-file')
 @click.option('--cache-host')
 @click.option('--cache-port')
 @click.option('--cache-db')
-def delete_cache(ctx, cache_file, cache_host, cache_port, cache_db):
-    remote_cache = all([cache_host, cache_port, cache_db])
-    cache = RedisCache(redis_file=None if remote_cache else (cache_file or 'data.db'),
-                       base='.agora/store',
-                       path='',
-                       redis_host=cache_host,
-                       redis_db=cache_db,
-                       redis_port=cache_port)
-    cache.r.flushdb()
-    g = get_triple_store(persist_mode=True, base='.agora/store/fragments')
-    for c in g.contexts():
-        g.remove_context(c)
-    g.remove((None, None, None))
+@click.option('--fragment', multiple=True)
+@click.option('--prefix', multiple=True)
+@click.option('--older-than', type=int)
+@click.option('--max-size', type=int)
+def delete_cache(ctx, cache_file, cache_host, cache_port, cache_db, fragment, prefix, older_than, max_size):
+    from agora_cli.cache import get_cache_kv, clear_memory, clear_fragments, evict_resources, evict_fragments, \
+        flush_cache
+
+    kv = get_cache_kv(cache_file, cache_host, cache_port, cache_db)
+    if not any([fragment, prefix, older_than is not None, max_size is not None]):
+        flush_cache(kv)
+        clear_fragments()
+    else:
+        report = {}
+        if prefix or older_than is not None or max_size is not None:
+            report.update(evict_resources(kv, prefixes=prefix or None, idle=older_than, max_size=max_size))
+        if fragment or older_than is not None:
+            report.update(evict_fragments(kv, fids=set(fragment) if fragment else None, older_than=older_than))
+        click.echo(jsonify(report))
+    clear_memory()
 
 
 @delete.command('am')
@@ -83,6 +101,8 @@ def delete_cache(ctx, cache_file, cache_host, cache_port, cache_db):
 @click.argument('amid')
 @click.pass_context
 def delete_access_mapping(ctx, id, amid):
+    from agora_gw.gateway import NotFoundError, GatewayError
+
     gw = ctx.obj['gw']
 
     try:
@@ -130,6 +150,8 @@ def delete_mapping(ctx, id, mid, turtle):
 @click.argument('id')
 @click.pass_context
 def delete_description(ctx, id):
+    from agora_gw.gateway import NotFoundError, GatewayError
+
     gw = ctx.obj['gw']
     try:
         gw.delete_description(id)
@@ -144,6 +166,8 @@ def delete_description(ctx, id):
 @click.argument('id')
 @click.pass_context
 def delete_resource(ctx, id):
+    from agora_gw.gateway import NotFoundError, GatewayError
+
     gw = ctx.obj['gw']
     try:
         gw.delete_resource(id)
@@ -158,6 +182,8 @@ def delete_resource(ctx, id):
 @click.argument('id')
 @click.pass_context
 def delete_enrichment(ctx, id):
+    from agora_gw.gateway import NotFoundError, GatewayError
+
     gw = ctx.obj['gw']
     try:
         gw.delete_enrichment(id)
@@ -18,19 +18,23 @@
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
 """
 
-from Queue import Queue, Empty
-from datetime import datetime
 from threading import Thread
 
 import click
-from agora import RedisCache
 from agora.engine.plan.agp import extend_uri
 from agora.engine.utils import Semaphore
 from agora_wot.gateway import DataGateway
 from rdflib import URIRef, RDF, Graph
 
+from agora_cli.cache import MEMORY_CACHE_SIZE, get_cache, get_cache_kv
+from agora_cli.hosts import get_hosts
+from agora_cli.loader import CONCURRENCY, install_loader, set_concurrency
 from agora_cli.root import cli
-from agora_cli.utils import show_thing, split_arg, check_init
+from agora_cli.stream import BUFFER_ROWS, BUFFER_BYTES, ChunkBuffer, StreamQueue, StreamAborted, gen_queue, \
+    write_chunks
+from agora_cli.terms import TermCache, n3_cache, nt_term
+from agora_cli.timing import split
+from agora_cli.utils import show_thing, split_arg, check_init, jsonify
 
 __author__ = 'Fernando Serena'
 
@@ -47,10 +51,20 @@ def get(ctx):
 @click.option('--port', default=80)
 @click.option('--turtle', default=False, is_flag=True)
 @click.option('--raw', default=False, is_flag=True)
+@click.option('--cache-file')
+@click.option('--cache-host')
+@click.option('--cache-port')
+@click.option('--cache-db')
+@click.option('--resource-cache', is_flag=True, default=False)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
 @click.pass_context
-def get_resource(ctx, uri, host, port, turtle, raw):
+def get_resource(ctx, uri, host, port, turtle, raw, cache_file, cache_host, cache_port, cache_db, resource_cache,
+                 concurrency):
     gw = ctx.obj['gw']
     ted = gw.ted
+    set_concurrency(concurrency)
+    # Resources are always dereferenced, the cache only keeps the validators of their endpoints
+    install_loader(ted, get_cache_kv(cache_file, cache_host, cache_port, cache_db) if resource_cache else None)
     dgw = DataGateway(gw.agora, ted, cache=None, port=port, server_name=host)
     g, headers = dgw.loader(uri)
 
@@ -82,53 +96,62 @@ def get_resource(ctx, uri, host, port, turtle, raw):
     show_thing(ag, format='text/turtle' if turtle else 'application/ld+json')
 
 
-def gen_thread(status, queue, fragment):
+def write_turtle(out, fragment, n3):
+    for prefix, uri in fragment['prefixes'].items():
+        out.write(u'@prefix {}: <{}> .\n'.format(prefix, uri))
+    out.write(u'\n')
+    for c, s, p, o in fragment['generator']:
+        out.write(u'{} {} {} .\n'.format(n3(s), n3(p), n3(o)), rows=1)
+
+
+def write_ntriples(out, fragment, n3):
+    for c, s, p, o in fragment['generator']:
+        out.write(u'{} {} {} .\n'.format(n3(s), n3(p), n3(o)), rows=1)
+
+
+def write_nquads(out, fragment, n3):
+    # Each triple pattern of the search plan is a named graph (blank node) in the stream
+    graphs = {}
+    for c, s, p, o in fragment['generator']:
+        if c not in graphs:
+            graphs[c] = u'_:tp{}'.format(len(graphs))
+            out.write(u'# {} {}\n'.format(graphs[c], c))
+        out.write(u'{} {} {} {} .\n'.format(n3(s), n3(p), n3(o), graphs[c]), rows=1)
+
+
+def write_agora_quads(out, fragment, n3):
+    for c, s, p, o in fragment['generator']:
+        out.write(u'{}·{}·{}·{}\n'.format(c, n3(s), n3(p), n3(o)), rows=1)
+
+
+# Writers and whether their terms are compacted with the namespaces of the search plan
+WRITERS = {
+    'turtle': (write_turtle, True),
+    'ntriples': (write_ntriples, False),
+    'nquads': (write_nquads, False),
+    'agora-quad': (write_agora_quads, False),
+    'agora-quad-min': (write_agora_quads, True)
+}
+
+
+def gen_thread(status, queue, fragment, format='turtle'):
+    out = ChunkBuffer.for_queue(queue)
+    writer, compact = WRITERS[format]
+    n3 = n3_cache(fragment['plan'].namespace_manager) if compact else TermCache(nt_term)
+    status['terms'] = n3
     try:
-        gen = fragment['generator']
-        plan = fragment['plan']
-        prefixes = fragment['prefixes']
-        first = True
-        best_mime = 'text/turtle'  # ''application/agora-quad'
-        min_quads = '-min' in best_mime
-        if best_mime.startswith('application/agora-quad'):
-            for c, s, p, o in gen:
-                if min_quads:
-                    quad = u'{}·{}·{}·{}\n'.format(c, s.n3(plan.namespace_manager),
-                                                   p.n3(plan.namespace_manager), o.n3(plan.namespace_manager))
-                else:
-                    quad = u'{}·{}·{}·{}\n'.format(c, s.n3(), p.n3(), o.n3())
-
-                queue.put(quad)
-        else:
-            if first:
-                for prefix, uri in prefixes.items():
-                    queue.put('@prefix {}: <{}> .\n'.format(prefix, uri))
-                queue.put('\n')
-            for c, s, p, o in gen:
-                triple = u'{} {} {} .\n'.format(s.n3(plan.namespace_manager),
-                                                p.n3(plan.namespace_manager), o.n3(plan.namespace_manager))
-
-                queue.put(triple)
+        with split(fragment['generator']) as quads:
+            writer(out, dict(fragment, generator=quads), n3)
+    except StreamAborted:
+        pass
     except Exception as e:
         status['exception'] = e
+    finally:
+        out.close()
 
     status['completed'] = True
 
 
-def gen_queue(status, stop_event, queue):
-    with stop_event:
-        while not status['completed'] or not queue.empty():
-            status['last'] = datetime.now()
-            try:
-                for chunk in queue.get(timeout=1.0):
-                    yield chunk
-            except Empty:
-                if not status['completed']:
-                    pass
-                elif status['exception']:
-                    raise Exception(status['exception'].message)
-
-
 @get.command()
 @click.argument('q')
 @click.option('--arg', multiple=True)
@@ -139,31 +162,30 @@ def gen_queue(status, stop_event, queue):
 @click.option('--cache-db')
 @click.option('--resource-cache', is_flag=True, default=False)
 @click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
 @click.option('--host', default='agora')
 @click.option('--port', default=80)
+@click.option('--buffer-rows', type=int, default=BUFFER_ROWS)
+@click.option('--buffer-bytes', type=int, default=BUFFER_BYTES)
+@click.option('--buffer-stats', is_flag=True, default=False)
+@click.option('--term-stats', is_flag=True, default=False)
+@click.option('--host-stats', is_flag=True, default=False)
+@click.option('--format', type=click.Choice(sorted(WRITERS)), default='turtle')
 @click.pass_context
 def fragment(ctx, q, arg, ignore_cycles, cache_file, cache_host, cache_port, cache_db, resource_cache, fragment_cache,
-             host, port):
+             memory_cache, concurrency, host, port, buffer_rows, buffer_bytes, buffer_stats, term_stats, host_stats,
+             format):
     args = dict(map(lambda a: split_arg(a), arg))
-    if cache_file:
-        path_parts = cache_file.split('/')
-        cache_base = '/'.join(cache_file.split('/')[:-1])
-        cache_file = path_parts[-1]
-
     if resource_cache or fragment_cache:
-        remote_cache = all([cache_host, cache_port, cache_db])
-        cache = RedisCache(redis_file=None if remote_cache else (cache_file or 'data.db'),
-                           base='.agora/store' if not cache_file else cache_base,
-                           path='',
-                           redis_host=cache_host,
-                           redis_db=cache_db,
-                           redis_port=cache_port)
+        cache = get_cache(cache_file, cache_host, cache_port, cache_db, memory_size=memory_cache)
     else:
         cache = None
     stop = Semaphore()
-    queue = Queue()
+    queue = StreamQueue(max_rows=buffer_rows, max_bytes=buffer_bytes)
 
     gw = ctx.obj['gw']
+    set_concurrency(concurrency)
     dgw = gw.data(q, cache=cache, lazy=False, host=host, port=port, base='.agora/store/fragments')
     with dgw:
 
@@ -172,9 +194,14 @@ def fragment(ctx, q, arg, ignore_cycles, cache_file, cache_host, cache_port, cac
             'completed': False,
             'exception': None
         }
-        stream_th = Thread(target=gen_thread, args=(request_status, queue, gen))
+        stream_th = Thread(target=gen_thread, args=(request_status, queue, gen, format))
         stream_th.daemon = False
         stream_th.start()
 
-        for chunk in gen_queue(request_status, stop, queue):
-            click.echo(chunk, nl=False)
+        write_chunks(gen_queue(request_status, stop, queue))
+        if buffer_stats:
+            click.echo(jsonify(queue.stats), err=True)
+        if term_stats:
+            click.echo(jsonify(request_status['terms'].stats), err=True)
+        if host_stats:
+            click.echo(jsonify(get_hosts().stats), err=True)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import time
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock
+from urlparse import urlparse
+
+__author__ = 'Fernando Serena'
+
+LIMITS = ['concurrency', 'rate', 'burst', 'retries', 'backoff']
+BACKOFF = 0.5
+# Statuses that tell a backend is overloaded or unavailable for a while
+RETRY_STATUS = {429, 502, 503, 504}
+
+
+class PrefixTrie(object):
+    """
+    Radix tree of URI prefixes. Edges are labelled with whole substrings, so looking up the longest prefix of a URI
+    takes one step per branching point on its path instead of one check per prefix.
+    """
+
+    __slots__ = ('children', 'value')
+
+    def __init__(self, items=None):
+        self.children = {}
+        self.value = None
+        for key, value in (items or {}).items():
+            self.insert(key, value)
+
+    def insert(self, key, value):
+        node = self
+        pos = 0
+        while pos < len(key):
+            edge = node.children.get(key[pos])
+            if edge is None:
+                child = PrefixTrie()
+                child.value = value
+                node.children[key[pos]] = (key[pos:], child)
+                return
+            label, child = edge
+            common = 0
+            while common < len(label) and pos + common < len(key) and label[common] == key[pos + common]:
+                common += 1
+            if common < len(label):
+                # Split the edge where key diverges from its label
+                middle = PrefixTrie()
+                middle.children[label[common]] = (label[common:], child)
+                node.children[key[pos]] = (label[:common], middle)
+                child = middle
+            node = child
+            pos += common
+        node.value = value
+
+    def longest_prefix(self, key):
+        """
+        Returns the length of the longest prefix of key in the trie and its value, or None.
+        """
+        node = self
+        pos = 0
+        match = None
+        while True:
+            if node.value is not None:
+                match = pos, node.value
+            if pos >= len(key):
+                return match
+            edge = node.children.get(key[pos])
+            if edge is None or not key.startswith(edge[0], pos):
+                return match
+            pos += len(edge[0])
+            node = edge[1]
+
+
+class TokenBucket(object):
+    """
+    Lets rate requests per second through on average, and bursts of up to burst requests. Tokens are reserved
+    in arrival order, so waiting requests are served first come, first served.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.__tokens = self.capacity
+        self.__stamp = time.time()
+        self.__lock = Lock()
+
+    def acquire(self):
+        with self.__lock:
+            now = time.time()
+            self.__tokens = min(self.capacity, self.__tokens + (now - self.__stamp) * self.rate)
+            self.__stamp = now
+            self.__tokens -= 1
+            wait = -self.__tokens / self.rate if self.__tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class HostLimit(object):
+    """
+    Dereferencing policy of one host: how many requests may be in flight, how many per second and how failed
+    requests are retried.
+    """
+
+    def __init__(self, concurrency=None, rate=None, burst=None, retries=0, backoff=BACKOFF):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries or 0
+        self.backoff = BACKOFF if backoff is None else backoff
+        self.__slots = BoundedSemaphore(concurrency) if concurrency else None
+        self.__bucket = TokenBucket(rate, burst) if rate else None
+        self.__lock = Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.throttled = 0.0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @contextmanager
+    def attempt(self):
+        if self.__slots is not None:
+            self.__slots.acquire()
+        try:
+            waited = self.__bucket.acquire() if self.__bucket is not None else 0
+            with self.__lock:
+                self.requests += 1
+                self.throttled += waited
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                yield
+            finally:
+                with self.__lock:
+                    self.in_flight -= 1
+        finally:
+            if self.__slots is not None:
+                self.__slots.release()
+
+    def delay(self, attempt):
+        return self.backoff * (2 ** attempt)
+
+    def call(self, f):
+        """
+        Calls f, that sends one request and returns its response, within the limits of the host. Connection errors
+        and overload statuses are retried with exponential backoff.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.attempt():
+                    response = f()
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                if attempt >= self.retries:
+                    # Still overloaded after every retry
+                    with self.__lock:
+                        self.failures += 1
+                    return response
+            except EnvironmentError:
+                if attempt >= self.retries:
+                    with self.__lock:
+                        self.failures += 1
+                    raise
+
+            with self.__lock:
+                self.retried += 1
+            time.sleep(self.delay(attempt))
+            attempt += 1
+
+    @property
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'retries': self.retried,
+            'failures': self.failures,
+            'throttled': round(self.throttled, 3),
+            'peak_in_flight': self.peak_in_flight
+        }
+
+
+class Hosts(object):
+    """
+    Rewrites URIs with the host replacements and keeps the limits of every host (after replacement) that is
+    dereferenced. Hosts without a configured limit are only accounted for.
+    """
+
+    def __init__(self, repls=None, limits=None):
+        self.repls = dict(repls or {})
+        self.limits = dict(limits or {})
+        self.__trie = PrefixTrie(self.repls)
+        self.__lock = Lock()
+        self.__hosts = {}
+
+    def rewrite(self, uri):
+        match = self.__trie.longest_prefix(uri)
+        if match is None:
+            return uri
+        length, replace = match
+        return replace + uri[length:]
+
+    def limit(self, host):
+        with self.__lock:
+            limit = self.__hosts.get(host)
+            if limit is None:
+                limit = HostLimit(**self.limits.get(host, {}))
+                self.__hosts[host] = limit
+            return limit
+
+    def call(self, uri, f):
+        """
+        Calls f with the replaced uri within the limits of its host.
+        """
+        uri = self.rewrite(uri)
+        return self.limit(urlparse(uri).netloc).call(lambda: f(uri))
+
+    @property
+    def stats(self):
+        with self.__lock:
+            return dict([(host, limit.stats) for host, limit in self.__hosts.items()])
+
+
+hosts = [Hosts()]
+
+
+def configure_hosts(repls, limits):
+    """
+    Makes dereferencing follow the given replacements and limits, compiling the replacements again when they
+    change. Accounting and in-flight requests are kept while nothing changes.
+    """
+    current = hosts[0]
+    if current.repls != (repls or {}) or current.limits != (limits or {}):
+        hosts[0] = Hosts(repls, limits)
+    return hosts[0]
+
+
+def get_hosts():
+    return hosts[0]
+
+
+def host_stats():
+    return get_hosts().stats
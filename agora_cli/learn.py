@@ -21,6 +21,8 @@ import click
 from agora_wot.utils import describe
 from rdflib import Graph, BNode
 
+from agora_cli.paths import update_path_index
+from agora_cli.plans import invalidate_plans
 from agora_cli.root import cli
 from agora_cli.utils import show_ted, check_init
 
@@ -42,6 +44,8 @@ def learn_extension(ctx, name, file):
     with open(file, 'r') as f:
         g = Graph().parse(f, format='turtle')
     gw.learn_extension(name, g)
+    invalidate_plans()
+    update_path_index(gw.agora.fountain)
 
 
 @learn.command('descriptions')
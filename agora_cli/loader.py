@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import hashlib
+import json
+import time
+from threading import BoundedSemaphore, Lock
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from agora_cli.codec import load_codec
+from agora_cli.hosts import configure_hosts, get_hosts
+from agora_cli.metrics import observe_dereference
+from agora_cli.mock import mock_uri
+from agora_cli.timing import phase
+from agora_cli.utils import load_host_replacements, load_host_limits
+
+__author__ = 'Fernando Serena'
+
+HTTP_KEY = 'cli:http'
+# Validators outlive the cached resources they revalidate
+VALIDATORS_TTL = 86400
+TIMEOUT = 300
+REVALIDATED_HEADERS = ['Cache-Control', 'Expires', 'ETag', 'Last-Modified', 'Date']
+CONCURRENCY = 8
+
+loaders = {}
+settings = {'concurrency': CONCURRENCY, 'stand_in': None}
+
+
+class HTTPLoader(object):
+    """
+    Fetches the endpoints of Thing Descriptions. With a kv, the validators (ETag, Last-Modified) and encoded body
+    of every response are kept there, and later requests revalidate with If-None-Match/If-Modified-Since; a 304 is
+    answered with the stored body. Each host is fetched through its own keep-alive session, and no more than
+    concurrency requests are in flight at a time. Hrefs are rewritten with the host replacements and fetched
+    within the limits of the resulting host.
+    """
+
+    def __init__(self, kv=None, concurrency=CONCURRENCY):
+        self.kv = kv
+        self.codec = load_codec(kv) if kv is not None else None
+        self.requests = 0
+        self.not_modified = 0
+        self.__lock = Lock()
+        self.__sessions = {}
+        self.concurrency = concurrency
+
+    @property
+    def concurrency(self):
+        return self.__concurrency
+
+    @concurrency.setter
+    def concurrency(self, concurrency):
+        with self.__lock:
+            self.__concurrency = max(1, concurrency)
+            self.__slots = BoundedSemaphore(self.__concurrency)
+            # Connection pools are sized with the concurrency, so sessions are built again on demand. Requests in
+            # flight keep the session and slots they started with.
+            self.__sessions = {}
+
+    def __close(self):
+        for session in self.__sessions.values():
+            session.close()
+        self.__sessions.clear()
+
+    def close(self):
+        with self.__lock:
+            self.__close()
+
+    def session(self, href):
+        parts = urlparse(href)
+        host = '{}://{}'.format(parts.scheme, parts.netloc)
+        with self.__lock:
+            session = self.__sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                session.mount(host, HTTPAdapter(pool_connections=1, pool_maxsize=self.__concurrency))
+                self.__sessions[host] = session
+            return session, self.__slots
+
+    def __send(self, href, headers):
+        host = urlparse(href).netloc
+        if settings['stand_in'] is not None:
+            href = mock_uri(settings['stand_in'], href)
+        session, slots = self.session(href)
+        with slots:
+            start = time.time()
+            status = 'error'
+            try:
+                response = session.get(href, headers=headers, timeout=TIMEOUT)
+                status = response.status_code
+                return response
+            finally:
+                observe_dereference(host, status, time.time() - start)
+
+    def fetch(self, href, headers):
+        with phase('dereferencing'):
+            return get_hosts().call(href, lambda uri: self.__send(uri, headers))
+
+    @property
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+            'hosts': len(self.__sessions),
+            'concurrency': self.__concurrency
+        }
+
+    def key(self, href, media):
+        return '{}:{}'.format(HTTP_KEY, hashlib.sha1('{} {}'.format(href, media)).hexdigest())
+
+    def get(self, href, media):
+        self.requests += 1
+        headers = {'Accept': media}
+        if self.kv is None:
+            return self.fetch(href, headers)
+
+        key = self.key(href, media)
+        stored = self.kv.hgetall(key)
+        if 'etag' in stored:
+            headers['If-None-Match'] = stored['etag']
+        if 'last_modified' in stored:
+            headers['If-Modified-Since'] = stored['last_modified']
+
+        response = self.fetch(href, headers)
+        if response.status_code == 304 and stored:
+            self.not_modified += 1
+            self.kv.expire(key, VALIDATORS_TTL)
+            return self.__stored_response(href, self.codec.decode(stored['body']), stored, response)
+
+        if response.status_code == 200:
+            self.__store(key, response)
+        return response
+
+    def __store(self, key, response):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+
+        validators = {
+            'body': self.codec.encode(response.content),
+            'headers': json.dumps(dict(response.headers)),
+            'encoding': response.encoding or ''
+        }
+        if etag:
+            validators['etag'] = etag
+        if last_modified:
+            validators['last_modified'] = last_modified
+
+        with self.kv.pipeline() as p:
+            p.delete(key)
+            p.hmset(key, validators)
+            p.expire(key, VALIDATORS_TTL)
+            p.execute()
+
+    @staticmethod
+    def __stored_response(href, body, stored, not_modified):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = href
+        response._content = body
+        response.encoding = stored['encoding'] or None
+        response.headers = CaseInsensitiveDict(json.loads(stored['headers']))
+        # A 304 carries the current caching headers of the resource
+        for header in REVALIDATED_HEADERS:
+            if header in not_modified.headers:
+                response.headers[header] = not_modified.headers[header]
+        return response
+
+    def intercept(self, media):
+        def wrapper(href):
+            return self.get(href, media)
+
+        return wrapper
+
+
+def get_loader(kv=None):
+    if kv not in loaders:
+        loaders[kv] = HTTPLoader(kv, concurrency=settings['concurrency'])
+    return loaders[kv]
+
+
+def set_concurrency(concurrency):
+    """
+    Sets how many resources are dereferenced at a time by every loader. Agora's plan executors keep following links
+    in their own shared pool: its threads wait on the follows they submit to it, so it is never resized.
+    """
+    concurrency = max(1, concurrency)
+    settings['concurrency'] = concurrency
+    for loader in loaders.values():
+        if loader.concurrency != concurrency:
+            loader.concurrency = concurrency
+
+
+def set_stand_in(base):
+    """
+    Sends every request to the local stand-in of the ecosystem hosts served at base (see agora_cli.mock), or to
+    the hosts themselves if base is None. Host replacements and limits still apply to the original hosts.
+    """
+    settings['stand_in'] = base
+
+
+def install_loader(ted, kv=None):
+    """
+    Makes every endpoint in the ecosystem of a TED go through the loader for kv. Thing Descriptions keep the
+    interceptor of their endpoints when cloned for parametrized resources.
+    """
+    configure_hosts(load_host_replacements(), load_host_limits())
+    loader = get_loader(kv)
+    for endpoint in ted.ecosystem.endpoints:
+        endpoint.intercept = loader.intercept(endpoint.media)
+    return loader
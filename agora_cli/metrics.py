@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import time
+from bisect import bisect_left
+from threading import Lock
+
+__author__ = 'Fernando Serena'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape(value):
+    return unicode(value).replace(u'\\', u'\\\\').replace(u'"', u'\\"').replace(u'\n', u'\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return u''
+    return u'{' + u','.join([u'{}="{}"'.format(k, escape(v)) for k, v in sorted(labels)]) + u'}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return u'+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return unicode(int(value))
+    return unicode(value)
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = Lock()
+        self._values = {}
+
+    @staticmethod
+    def key(labels):
+        return tuple(sorted(labels.items()))
+
+    def header(self):
+        return [u'# HELP {} {}'.format(self.name, self.help), u'# TYPE {} {}'.format(self.name, self.type)]
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in sorted(self._values.items())]
+
+    def expose(self):
+        lines = self.header()
+        for name, labels, value in self.samples():
+            lines.append(u'{}{} {}'.format(name, format_labels(labels), format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = counts, total + value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                acc = 0
+                for le, count in zip(self.buckets, counts):
+                    acc += count
+                    samples.append((self.name + '_bucket', labels + (('le', format_value(le)),), acc))
+                samples.append((self.name + '_sum', labels, total))
+                samples.append((self.name + '_count', labels, acc))
+        return samples
+
+
+class Collected(Metric):
+    """
+    Metric whose samples are read at scrape time from f, which returns (labels dict, value) pairs.
+    """
+
+    def __init__(self, name, help, type, f):
+        super(Collected, self).__init__(name, help)
+        self.type = type
+        self.f = f
+
+    def samples(self):
+        return [(self.name, self.key(labels), value) for labels, value in self.f()]
+
+
+class Registry(object):
+    def __init__(self):
+        self.enabled = False
+        self.__metrics = []
+
+    def register(self, metric):
+        self.__metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self.__metrics:
+            lines.extend(metric.expose())
+        return u'\n'.join(lines) + u'\n'
+
+
+registry = Registry()
+
+request_latency = registry.register(
+    Histogram('agora_request_duration_seconds', 'Time to serve a request, until its response is closed'))
+in_flight = registry.register(Gauge('agora_requests_in_flight', 'Requests being served'))
+queries_in_flight = registry.register(Gauge('agora_queries_in_flight', 'Queries and fragments being streamed'))
+streamed = registry.register(Counter('agora_streamed_total', 'Rows (queries) and triples (fragments) streamed'))
+dereferences = registry.register(
+    Histogram('agora_dereference_duration_seconds', 'Time to dereference a resource endpoint, by host'))
+
+
+def cache_samples(stat):
+    def f():
+        from agora_cli.cache import caches
+
+        return [({'cache': str(i)}, cache.stats[stat]) for i, cache in enumerate(caches.values())]
+
+    return f
+
+
+def host_samples(stat):
+    def f():
+        from agora_cli.hosts import get_hosts
+
+        return [({'host': host}, stats[stat]) for host, stats in sorted(get_hosts().stats.items())]
+
+    return f
+
+
+registry.register(Collected('agora_cache_hits_total', 'Resources served from memory', 'counter',
+                            cache_samples('hits')))
+registry.register(Collected('agora_cache_misses_total', 'Resources not in memory', 'counter',
+                            cache_samples('misses')))
+registry.register(Collected('agora_cache_loads_total', 'Resources dereferenced into the cache', 'counter',
+                            cache_samples('loads')))
+registry.register(Collected('agora_dereference_retries_total', 'Dereferences retried, by host', 'counter',
+                            host_samples('retries')))
+
+
+def observe_dereference(host, status, seconds):
+    if registry.enabled:
+        dereferences.observe(seconds, host=host, status=status)
+
+
+def stream(kind, iterable):
+    """
+    Yields the items of a query or fragment generator, counting them and the streams in flight.
+    """
+    if not registry.enabled:
+        for item in iterable:
+            yield item
+        return
+
+    queries_in_flight.inc(kind=kind)
+    try:
+        for item in iterable:
+            streamed.inc(kind=kind)
+            yield item
+    finally:
+        queries_in_flight.dec(kind=kind)
+
+
+def instrument_app(app):
+    """
+    Measures every request of a Flask app and serves the metrics of the process in /metrics.
+    """
+    from flask import request, Response
+
+    registry.enabled = True
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.expose(), content_type=CONTENT_TYPE)
+
+    @app.before_request
+    def start_request():
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request.environ['agora.metrics'] = route, time.time()
+        in_flight.inc(route=route)
+
+    @app.after_request
+    def end_request(response):
+        route, start = request.environ['agora.metrics']
+        method = request.method
+
+        def finish():
+            in_flight.dec(route=route)
+            request_latency.observe(time.time() - start, route=route, method=method, status=response.status_code)
+
+        response.call_on_close(finish)
+        return response
+
+    return app
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import json
+import os
+import os.path as path
+import time
+import zlib
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from threading import Lock, Thread
+from urllib import quote, unquote
+from urlparse import urlparse
+
+import requests
+
+__author__ = 'Fernando Serena'
+
+# File of the resources whose path is empty or ends with a slash
+INDEX = '_index'
+MAX_AGE = 300
+TIMEOUT = 300
+
+
+def resource_path(root, uri):
+    """
+    Returns the file under root that stands for the resource at uri: <scheme>/<host>/<path>[?<query>], every
+    segment percent-encoded.
+    """
+    parts = urlparse(uri)
+    rel = parts.path.lstrip('/')
+    if not rel or rel.endswith('/'):
+        rel += INDEX
+    if parts.query:
+        rel += '?' + parts.query
+    segments = [quote(s, safe='') for s in rel.split('/')]
+    segments = [s.replace('.', '%2E') if s in ('.', '..') else s for s in segments]
+    return path.join(root, parts.scheme, quote(parts.netloc, safe=''), *segments)
+
+
+def mock_uri(base, uri):
+    """
+    Returns the URI of the resource at uri in the stand-in served at base.
+    """
+    parts = urlparse(uri)
+    rest = parts.path or '/'
+    if parts.query:
+        rest += '?' + parts.query
+    return '{}/{}/{}{}'.format(base, parts.scheme, parts.netloc, rest)
+
+
+def original_uri(mock_path):
+    scheme, _, rest = mock_path.lstrip('/').partition('/')
+    netloc, _, rest = rest.partition('/')
+    return '{}://{}/{}'.format(scheme, unquote(netloc), rest)
+
+
+class FileSource(object):
+    """
+    Resources kept in files under root (see resource_path). When recording, the ones that are not there yet are
+    fetched from their host and kept.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    @property
+    def bases(self):
+        bases = []
+        for scheme in sorted(os.listdir(self.root)):
+            if path.isdir(path.join(self.root, scheme)):
+                for netloc in sorted(os.listdir(path.join(self.root, scheme))):
+                    if path.isdir(path.join(self.root, scheme, netloc)):
+                        bases.append('{}://{}/'.format(scheme, unquote(netloc)))
+        return bases
+
+    def get(self, uri, media):
+        file_path = resource_path(self.root, uri)
+        if not path.isfile(file_path):
+            return None
+        st = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            return f.read(), '"{:x}-{:x}"'.format(int(st.st_mtime), st.st_size)
+
+    def record(self, uri, media):
+        response = requests.get(uri, headers={'Accept': media}, timeout=TIMEOUT)
+        if response.status_code != 200:
+            return False
+
+        file_path = resource_path(self.root, uri)
+        if not path.isdir(path.dirname(file_path)):
+            try:
+                os.makedirs(path.dirname(file_path))
+            except OSError:
+                pass
+        tmp = '{}.{}.tmp'.format(file_path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(response.content)
+        os.rename(tmp, file_path)
+        return True
+
+
+class SyntheticSource(object):
+    """
+    Resources of a synthetic ecosystem (see agora_cli.synthetic), generated when they are requested.
+    """
+
+    def __init__(self, synthetic):
+        self.synthetic = synthetic
+
+    @property
+    def bases(self):
+        return self.synthetic.bases
+
+    def get(self, uri, media):
+        doc = self.synthetic.document(uri)
+        if doc is None:
+            return None
+        body = json.dumps(doc)
+        return body, '"{:x}"'.format(zlib.crc32(body) & 0xffffffff)
+
+    def record(self, uri, media):
+        return False
+
+
+def load_source(root):
+    from agora_cli.synthetic import SPEC_FILE, Synthetic
+
+    spec = path.join(root, SPEC_FILE)
+    if path.isfile(spec):
+        return SyntheticSource(Synthetic.load(spec))
+    return FileSource(root)
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in of the hosts of an ecosystem that serves their resources from root, with the media type the
+    client accepts, an ETag and a max-age. Roots with a synthetic ecosystem spec serve its generated resources,
+    any other serves files.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root, record=False, latency=0.0, max_age=MAX_AGE, address=('127.0.0.1', 0)):
+        HTTPServer.__init__(self, address, ResourceHandler)
+        self.root = root
+        self.source = load_source(root)
+        self.record = record
+        self.latency = latency
+        self.max_age = max_age
+        self.lock = Lock()
+        self.served = 0
+        self.not_modified = 0
+        self.missing = 0
+        self.recorded = 0
+
+    @property
+    def base(self):
+        return 'http://{}:{}'.format(self.server_address[0], self.server_port)
+
+    def handle_error(self, request, client_address):
+        # Clients closing their keep-alive connections
+        pass
+
+    def count(self, stat):
+        with self.lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+
+    def lookup(self, uri, media):
+        found = self.source.get(uri, media)
+        if found is None and self.record:
+            try:
+                if self.source.record(uri, media):
+                    self.count('recorded')
+                    found = self.source.get(uri, media)
+            except Exception:
+                pass
+        return found
+
+    def start(self):
+        th = Thread(target=self.serve_forever)
+        th.daemon = True
+        th.start()
+        return self
+
+    @property
+    def stats(self):
+        return {
+            'served': self.served,
+            'not_modified': self.not_modified,
+            'missing': self.missing,
+            'recorded': self.recorded
+        }
+
+
+class ResourceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Responses leave in one segment, otherwise keep-alive connections stall on delayed ACKs
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def media(self):
+        accept = self.headers.get('Accept', '')
+        if not accept or ',' in accept or '*' in accept:
+            return 'application/octet-stream'
+        return accept.split(';')[0].strip()
+
+    def empty(self, status, headers=None):
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        found = server.lookup(original_uri(self.path), self.media())
+        if found is None:
+            server.count('missing')
+            return self.empty(404)
+
+        body, etag = found
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'max-age={}'.format(server.max_age)
+        }
+        if self.headers.get('If-None-Match') == etag:
+            server.count('not_modified')
+            return self.empty(304, headers)
+
+        server.count('served')
+        self.send_response(200)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header('Content-Type', self.media())
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import hashlib
+import json
+import os
+import os.path as path
+import time
+from copy import deepcopy
+from threading import Lock
+
+from agora_cli.plans import schema_version
+
+__author__ = 'Fernando Serena'
+
+PATH_INDEX_FILE = '.agora/store/paths.json'
+
+
+def components(fountain):
+    """
+    Groups the types and properties of the schema that are related through domains, ranges, inverses, super and
+    sub types or references. Paths from a type to another never leave their group.
+    """
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(x, others):
+        for o in others:
+            parent[find(o)] = find(x)
+
+    described = {}
+    for p in fountain.properties:
+        d = fountain.get_property(p)
+        described[p] = {'domain': sorted(d['domain']), 'range': sorted(d['range']), 'inverse': sorted(d['inverse']),
+                        'constraints': sorted([[k, sorted(v)] for k, v in d['constraints'].items()]),
+                        'type': d['type']}
+        union(p, d['domain'] + d['inverse'] + (d['range'] if d['type'] == 'object' else []))
+    for t in fountain.types:
+        d = fountain.get_type(t)
+        described[t] = dict([(k, sorted([e for e in v if e != t])) for k, v in d.items()])
+        union(t, d['super'] + d['sub'] + d['refs'] + d['properties'])
+
+    groups = {}
+    for elm in parent:
+        groups.setdefault(find(elm), []).append(elm)
+
+    signatures = {}
+    for members in groups.values():
+        h = hashlib.sha1()
+        h.update(json.dumps(sorted([[m, described.get(m)] for m in members])))
+        for m in members:
+            signatures[m] = h.hexdigest()
+    return signatures
+
+
+class CleanIndex(object):
+    """
+    Index of a fountain whose type descriptions are private copies, as they were before any path search. The path
+    manager adds a type to its own super types when it finds no path from it to itself, and the index hands out
+    the same cached descriptions to every thread.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.__types = {}
+
+    def get_type(self, ty):
+        if ty not in self.__types:
+            description = deepcopy(self.index.get_type(ty))
+            description['super'] = [s for s in description['super'] if s != ty]
+            self.__types[ty] = description
+        return self.__types[ty]
+
+    def __getattr__(self, item):
+        return getattr(self.index, item)
+
+
+def search_paths(fountain, elm, force_seed):
+    """
+    Paths to elm from force_seed as a fresh fountain would find them: searches leave traces in the state of the
+    path manager and the index that change the result of the next ones, so they run on a copy of both.
+    """
+    from networkx import DiGraph
+    from agora.engine.fountain import path as fountain_path
+
+    # Simple paths are cached by graph, so a copy of it keeps them apart from those of the fountain
+    graph = DiGraph(fountain.path_manager.path_graph)
+    try:
+        found, cycles = fountain_path._find_path(CleanIndex(fountain.index), fountain.seed_manager, graph, elm,
+                                                 force_seed=force_seed)
+        return {'paths': found, 'all-cycles': cycles}
+    finally:
+        for key in [k for k in fountain_path.paths_cache.keys() if k[0] is graph]:
+            fountain_path.paths_cache.pop(key, None)
+
+
+def canonical(steps):
+    return json.dumps(steps, sort_keys=True)
+
+
+def seed_key(elm, seed_types):
+    return json.dumps([elm] + list(seed_types))
+
+
+class PathIndex(object):
+    """
+    Paths to every type of the learned extensions from a seed of every other type, kept in file_path for the schema
+    version they were found for. Paths from several seed types are found the first time they are asked for and kept
+    as well. Cycles are kept by their steps, as their ids change with every schema.
+    """
+
+    def __init__(self, file_path=PATH_INDEX_FILE):
+        self.file_path = file_path
+        self.__data = None
+        self.__ids = None
+        self.__mtime = None
+        self.__lock = Lock()
+
+    @property
+    def exists(self):
+        return path.isfile(self.file_path)
+
+    def __load(self):
+        try:
+            mtime = os.stat(self.file_path).st_mtime
+        except OSError:
+            self.__data, self.__mtime = None, None
+            return None
+        if mtime != self.__mtime:
+            try:
+                with open(self.file_path) as f:
+                    self.__data = json.load(f)
+                self.__ids = dict([(canonical(steps), i) for i, steps in enumerate(self.__data['cycles'])])
+            except (IOError, ValueError, KeyError):
+                self.__data = None
+            self.__mtime = mtime
+        return self.__data
+
+    def __store(self, data):
+        base = path.dirname(self.file_path)
+        if base and not path.isdir(base):
+            os.makedirs(base)
+        tmp = '{}.{}.tmp'.format(self.file_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp, self.file_path)
+
+    @property
+    def data(self):
+        with self.__lock:
+            return self.__load()
+
+    @property
+    def current(self):
+        data = self.data
+        if data is not None and data['version'] == schema_version():
+            return data
+
+    @property
+    def state(self):
+        """
+        When the index in use was built, or None if there is none up to date with the schema.
+        """
+        data = self.current
+        if data is not None:
+            return data.get('built', 0)
+
+    @staticmethod
+    def encode(found, force_seed, cycles, component):
+        by_uri = dict([(uri, ty) for uri, ty in force_seed])
+        return {
+            'component': component,
+            'paths': [{'seeds': [by_uri[uri] for uri in p['seeds']],
+                       'steps': p['steps'],
+                       'cycles': [canonical(cycles[c]) for c in sorted(p['cycles']) if c < len(cycles)]}
+                      for p in found['paths']],
+            'all-cycles': [canonical(c['steps']) for c in found['all-cycles']]
+        }
+
+    def build(self, fountain, rebuild=False):
+        """
+        Finds the paths of the groups of types (see components) that changed since the index was built, or of all of
+        them with rebuild. Returns what was done.
+        """
+        start = time.time()
+        previous = None if rebuild else self.data
+        previous_types = previous['types'] if previous is not None else {}
+        previous_paths = previous['paths'] if previous is not None else {}
+        signatures = components(fountain)
+        types = sorted(fountain.types)
+        cycles = [eval(c) for c in fountain.index.r.zrange('cycles', 0, -1)]
+        data = {'version': schema_version(), 'built': start, 'types': {}, 'paths': {}, 'reach': {}, 'cycles': cycles}
+        for t in types:
+            ids = sorted([int(c) for c in fountain.index.r.smembers('cycles:{}'.format(t))])
+            data['types'][t] = {'component': signatures[t],
+                                'cycles': [canonical(cycles[c]) for c in ids if c < len(cycles)]}
+
+        computed = reused = 0
+        for dest in types:
+            unchanged = dest in previous_types and previous_types[dest]['component'] == signatures[dest]
+            for source in types:
+                if signatures[source] != signatures[dest]:
+                    continue
+                key = seed_key(dest, [source])
+                entry = previous_paths.get(key, {'paths': []})
+                if unchanged:
+                    reused += 1
+                else:
+                    seed = [('<{}>'.format(source), source)]
+                    entry = self.encode(search_paths(fountain, dest, seed), seed, cycles, signatures[dest])
+                    computed += 1
+                if entry['paths']:
+                    data['paths'][key] = entry
+                    data['reach'].setdefault(source, {})[dest] = min([len(p['steps']) for p in entry['paths']])
+
+        # Paths from several seed types are kept while the types they go to stay the same
+        for key, entry in previous_paths.items():
+            elms = json.loads(key)
+            if len(elms) > 2 and all([e in types for e in elms]) and entry['component'] == signatures[elms[0]]:
+                data['paths'][key] = entry
+
+        with self.__lock:
+            self.__store(data)
+        return {
+            'types': len(types),
+            'components': len(set([signatures[t] for t in types])),
+            'computed': computed,
+            'reused': reused,
+            'reachable': sum([len(r) for r in data['reach'].values()]),
+            'time': round(time.time() - start, 4)
+        }
+
+    def indexable(self, elm, force_seed):
+        data = self.current
+        seed_types = [ty for _, ty in force_seed or []]
+        return data is not None and bool(seed_types) and len(set(seed_types)) == len(seed_types) and \
+            elm in data['types'] and all([ty in data['types'] for ty in seed_types])
+
+    def paths(self, elm, force_seed=None, shortest=False):
+        """
+        Returns the paths to elm from force_seed as fountain.get_paths does, or None if they are not in the index.
+        """
+        if not self.indexable(elm, force_seed):
+            return None
+        with self.__lock:
+            data = self.__load()
+            ids = self.__ids
+        seed_types = [ty for _, ty in force_seed]
+        entry = data['paths'].get(seed_key(elm, seed_types))
+        if entry is None and len(seed_types) == 1:
+            # Types without paths between them are not kept
+            entry = {'paths': [], 'all-cycles': data['types'][elm]['cycles']}
+        if entry is None or not all([c in ids for c in entry['all-cycles']]):
+            return None
+
+        by_type = dict([(ty, uri) for uri, ty in force_seed])
+        seed_paths = [{'seeds': [by_type[ty] for ty in p['seeds']],
+                       'steps': p['steps'],
+                       'cycles': [ids[c] for c in p['cycles'] if c in ids]} for p in entry['paths']]
+        if shortest and seed_paths:
+            hops = min([len(p['steps']) for p in seed_paths])
+            seed_paths = filter(lambda p: len(p['steps']) == hops, seed_paths)
+        return {'paths': seed_paths,
+                'all-cycles': [{'cycle': ids[c], 'steps': json.loads(c)} for c in entry['all-cycles']]}
+
+    def remember(self, elm, force_seed, found):
+        """
+        Keeps the paths found for elm from several seed types.
+        """
+        with self.__lock:
+            data = self.__load()
+            if data is None or data['version'] != schema_version():
+                return
+            entry = self.encode(found, force_seed, data['cycles'], data['types'][elm]['component'])
+            data['paths'][seed_key(elm, [ty for _, ty in force_seed])] = entry
+            self.__store(data)
+
+
+path_indexes = {}
+
+
+def get_path_index(file_path=PATH_INDEX_FILE):
+    if file_path not in path_indexes:
+        path_indexes[file_path] = PathIndex(file_path)
+    return path_indexes[file_path]
+
+
+def update_path_index(fountain):
+    """
+    Brings the path index up to date with the schema after an extension or prefix changed, if there is one.
+    """
+    index = get_path_index()
+    if index.exists:
+        return index.build(getattr(fountain, 'indexed', fountain))
+
+
+class IndexedFountain(object):
+    """
+    Fountain whose paths come from the path index while it is up to date with the schema, and are searched as
+    usual otherwise. Planners reach the fountain through agora's Wrapper, which only sees attributes of the class.
+    """
+
+    def __init__(self, fountain, index):
+        self.indexed = fountain
+        self.index_paths = index
+
+    @property
+    def paths_state(self):
+        return self.index_paths.state
+
+    def get_paths(self, elm, force_seed=None):
+        found = self.index_paths.paths(elm, force_seed=force_seed)
+        if found is None:
+            if not self.index_paths.indexable(elm, force_seed):
+                return self.indexed.get_paths(elm, force_seed=force_seed)
+            found = search_paths(self.indexed, elm, force_seed)
+            self.index_paths.remember(elm, force_seed, found)
+        return found
+
+    def add_vocabulary(self, owl):
+        return self.indexed.add_vocabulary(owl)
+
+    def update_vocabulary(self, vid, owl):
+        return self.indexed.update_vocabulary(vid, owl)
+
+    def delete_vocabulary(self, vid):
+        return self.indexed.delete_vocabulary(vid)
+
+    def get_vocabulary(self, vid):
+        return self.indexed.get_vocabulary(vid)
+
+    @property
+    def vocabularies(self):
+        return self.indexed.vocabularies
+
+    @property
+    def types(self):
+        return self.indexed.types
+
+    @property
+    def properties(self):
+        return self.indexed.properties
+
+    def get_type(self, type):
+        return self.indexed.get_type(type)
+
+    def get_property(self, property):
+        return self.indexed.get_property(property)
+
+    def connected(self, source, target):
+        return self.indexed.connected(source, target)
+
+    @property
+    def prefixes(self):
+        return self.indexed.prefixes
+
+    def add_prefixes(self, prefixes):
+        return self.indexed.add_prefixes(prefixes)
+
+    def add_seed(self, uri, type):
+        return self.indexed.add_seed(uri, type)
+
+    @property
+    def seeds(self):
+        return self.indexed.seeds
+
+    def get_seed(self, sid):
+        return self.indexed.get_seed(sid)
+
+    def get_type_seeds(self, type):
+        return self.indexed.get_type_seeds(type)
+
+    def delete_seed(self, sid):
+        return self.indexed.delete_seed(sid)
+
+    def delete_type_seeds(self, type):
+        return self.indexed.delete_type_seeds(type)
+
+    def get_seed_type_digest(self, type):
+        return self.indexed.get_seed_type_digest(type)
+
+    def __getattr__(self, item):
+        return getattr(self.indexed, item)
+
+
+def index_paths(agora):
+    from agora.engine.fountain import Fountain
+    from agora.engine.plan import Planner
+
+    planner = agora.planner
+    if type(planner) is Planner and isinstance(planner.fountain, Fountain):
+        agora.planner = Planner(IndexedFountain(planner.fountain, get_path_index()))
+    return agora
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import hashlib
+import json
+import os
+import os.path as path
+import shutil
+from collections import OrderedDict
+from threading import Lock
+
+__author__ = 'Fernando Serena'
+
+PLANS_BASE = '.agora/store/plans'
+VERSION_FILE = 'version'
+PLAN_CACHE_SIZE = 256
+
+
+def schema_version(base=PLANS_BASE):
+    try:
+        with open(path.join(base, VERSION_FILE)) as f:
+            return int(f.read().strip() or 0)
+    except (IOError, ValueError):
+        return 0
+
+
+def invalidate_plans(base=PLANS_BASE):
+    """
+    Tells every plan cache on base that the schema changed: plans made so far are removed and any process still
+    holding them in memory stops using them, as they are keyed by the schema version.
+    """
+    version = schema_version(base) + 1
+    shutil.rmtree(base, ignore_errors=True)
+    os.makedirs(base)
+    with open(path.join(base, VERSION_FILE), 'w') as f:
+        f.write(str(version))
+    for cache in plan_caches.values():
+        cache.clear()
+
+
+def encode_plan(plan, seeds):
+    return {
+        'namespaces': [[prefix, unicode(uri)] for prefix, uri in plan.namespaces()],
+        'quads': [[s.n3(), p.n3(), o.n3(), c.identifier.n3()] for s, p, o, c in plan.quads((None, None, None))],
+        'seeds': dict([(unicode(uri), unicode(ty)) for uri, ty in seeds])
+    }
+
+
+def decode_plan(data):
+    from rdflib import URIRef
+    from rdflib.util import from_n3
+
+    return {
+        'namespaces': [(prefix, URIRef(uri)) for prefix, uri in data['namespaces']],
+        'quads': [tuple(map(from_n3, quad)) for quad in data['quads']],
+        'seeds': dict([(URIRef(uri), ty) for uri, ty in data['seeds'].items()])
+    }
+
+
+def build_plan(entry, force_seed):
+    """
+    Returns a new plan graph from a cache entry, with the seeds it was made with replaced by the given ones.
+    """
+    from rdflib import ConjunctiveGraph
+
+    by_type = dict([(unicode(ty), uri) for uri, ty in force_seed])
+    replace = dict([(old, by_type[ty]) for old, ty in entry['seeds'].items()])
+    plan = ConjunctiveGraph()
+    for prefix, uri in entry['namespaces']:
+        plan.bind(prefix, uri)
+    for s, p, o, c in entry['quads']:
+        plan.get_context(c).add((replace.get(s, s), p, replace.get(o, o)))
+    return plan
+
+
+class PlanCache(object):
+    """
+    Search plans by key, the last size used in memory and all of them in files under base.
+    """
+
+    def __init__(self, base=PLANS_BASE, size=PLAN_CACHE_SIZE):
+        self.base = base
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.__plans = OrderedDict()
+        self.__lock = Lock()
+
+    def __file(self, key):
+        return path.join(self.base, key + '.json')
+
+    def __remember(self, key, entry):
+        with self.__lock:
+            self.__plans.pop(key, None)
+            self.__plans[key] = entry
+            while len(self.__plans) > self.size:
+                self.__plans.popitem(last=False)
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__plans.pop(key, None)
+            if entry is not None:
+                self.__plans[key] = entry
+                self.hits += 1
+                return entry
+
+        try:
+            with open(self.__file(key)) as f:
+                entry = decode_plan(json.load(f))
+        except (IOError, ValueError, KeyError):
+            with self.__lock:
+                self.misses += 1
+            return None
+
+        self.__remember(key, entry)
+        with self.__lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key, data):
+        entry = decode_plan(data)
+        self.__remember(key, entry)
+        try:
+            if not path.isdir(self.base):
+                os.makedirs(self.base)
+            tmp = '{}.{}.tmp'.format(self.__file(key), os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.rename(tmp, self.__file(key))
+        except (IOError, OSError):
+            pass
+        return entry
+
+    def clear(self):
+        with self.__lock:
+            self.__plans.clear()
+
+    @property
+    def stats(self):
+        with self.__lock:
+            return {'entries': len(self.__plans), 'hits': self.hits, 'misses': self.misses}
+
+
+plan_caches = {}
+
+
+def get_plan_cache(base=PLANS_BASE):
+    if base not in plan_caches:
+        plan_caches[base] = PlanCache(base)
+    return plan_caches[base]
+
+
+class CachedPlanner(object):
+    """
+    Planner that makes every search plan once per normalized graph pattern, seed types, schema and path index.
+    Forced seeds are fresh URIs on every call, so plans are kept with the seeds they were made with and handed out
+    with the new ones.
+    """
+
+    def __init__(self, planner, cache):
+        self.planner = planner
+        self.cache = cache
+        self.__fingerprint = None
+
+    @property
+    def fingerprint(self):
+        # Vocabularies and prefixes the schema had when the planner was wrapped
+        if self.__fingerprint is None:
+            fountain = self.planner.fountain
+            self.__fingerprint = json.dumps([sorted(fountain.vocabularies), sorted(fountain.prefixes.items())])
+        return self.__fingerprint
+
+    def key(self, agp, force_seed):
+        h = hashlib.sha1()
+        h.update(str(schema_version(self.cache.base)))
+        h.update(self.fingerprint)
+        # Plans made from the path index may differ from those made searching paths on the fountain
+        h.update(json.dumps(getattr(self.planner.fountain, 'paths_state', None)))
+        h.update(json.dumps(sorted([repr(tp) for tp in agp])))
+        h.update(json.dumps(sorted(agp.prefixes.items())))
+        h.update(json.dumps(sorted([unicode(ty) for _, ty in force_seed or []])))
+        return h.hexdigest()
+
+    def make_plan(self, agp, force_seed=None):
+        seeds = list(force_seed or [])
+        if len(set([ty for _, ty in seeds])) < len(seeds):
+            # Seeds can only be told apart by their type
+            return self.planner.make_plan(agp, force_seed=force_seed)
+
+        key = self.key(agp, seeds)
+        entry = self.cache.get(key)
+        if entry is None:
+            plan = self.planner.make_plan(agp, force_seed=force_seed)
+            self.cache.put(key, encode_plan(plan, seeds))
+            return plan
+        return build_plan(entry, seeds)
+
+    def __getattr__(self, item):
+        return getattr(self.planner, item)
+
+
+def cache_plans(agora):
+    if not isinstance(agora.planner, CachedPlanner):
+        agora.planner = CachedPlanner(agora.planner, get_plan_cache())
+    return agora
@@ -32,8 +32,12 @@ from agora_wot.gateway import DataGateway
 from flask import Flask
 from flask_cors import CORS
 
+from agora_cli.cache import MEMORY_CACHE_SIZE, get_cache
+from agora_cli.loader import CONCURRENCY, set_concurrency
+from agora_cli.metrics import instrument_app as expose_metrics, stream
 from agora_cli.root import cli
-from agora_cli.utils import check_init
+from agora_cli.timing import instrument_app, timings
+from agora_cli.utils import check_init, jsonify
 
 __author__ = 'Fernando Serena'
 
@@ -44,6 +48,16 @@ def publish(ctx):
     check_init(ctx)
 
 
+def instrument(ctx, app, metrics=False):
+    # With --profile or --timings, servers report each request on its own
+    profiler = ctx.obj.get('profiler')
+    if profiler is not None or timings.enabled:
+        instrument_app(app, profiler=profiler, report=lambda r: click.echo(jsonify(r), err=True))
+    if metrics:
+        expose_metrics(app)
+    return app
+
+
 @publish.command('ecosystem')
 @click.pass_context
 @click.option('--query', required=True)
@@ -59,7 +73,7 @@ def publish_ecosystem(ctx, query, host, port, cache_file):
     dgw = DataGateway(ctx.obj['gw'].agora, ted, cache=cache, port=port, server_name=host)
     dgw.server.gw.config['ENV'] = 'development'
 
-    CORS(dgw.server.gw)
+    CORS(instrument(ctx, dgw.server.gw))
     dgw.server.gw.run(host='0.0.0.0', port=port, threaded=True)
 
 
@@ -85,10 +99,11 @@ def publish_gateway(ctx, port):
 @publish.command('fountain')
 @click.pass_context
 @click.option('--port', default=5000)
-def publish_fountain(ctx, port):
+@click.option('--metrics', is_flag=True, default=False, help='Serve Prometheus metrics in /metrics')
+def publish_fountain(ctx, port, metrics):
     fountain = ctx.obj['gw'].agora.fountain
     server = fs(fountain)
-    CORS(server)
+    CORS(instrument(ctx, server, metrics=metrics))
     server.run(host='0.0.0.0', port=port, threaded=True)
 
 
@@ -98,7 +113,7 @@ def publish_fountain(ctx, port):
 def publish_planner(ctx, port):
     planner = ctx.obj['gw'].agora.planner
     server = ps(planner)
-    CORS(server)
+    CORS(instrument(ctx, server))
     server.run(host='0.0.0.0', port=port, threaded=True)
 
 
@@ -107,7 +122,7 @@ def query_f(dgw, incremental, scholar, ignore_cycles):
         kwargs['incremental'] = incremental
         kwargs['scholar'] = scholar
         kwargs['follow_cycles'] = not ignore_cycles
-        return dgw.query(*args, **kwargs)
+        return stream('rows', dgw.query(*args, **kwargs))
 
     return wrapper
 
@@ -122,37 +137,28 @@ def query_f(dgw, incremental, scholar, ignore_cycles):
 @click.option('--cache-db')
 @click.option('--resource-cache', is_flag=True, default=False)
 @click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
 @click.option('--host', default='agora')
 @click.option('--port', default=80)
+@click.option('--metrics', is_flag=True, default=False, help='Serve Prometheus metrics in /metrics')
 @click.pass_context
 def publish_sparql(ctx, query, incremental, ignore_cycles, cache_file, cache_host, cache_port, cache_db, resource_cache,
-                   fragment_cache,
-                   host,
-                   port):
+                   fragment_cache, memory_cache, concurrency, host, port, metrics):
     check_init(ctx)
 
-    if cache_file:
-        path_parts = cache_file.split('/')
-        cache_base = '/'.join(cache_file.split('/')[:-1])
-        cache_file = path_parts[-1]
-
     if resource_cache or fragment_cache:
-        remote_cache = all([cache_host, cache_port, cache_db])
-        cache = RedisCache(redis_file=None if remote_cache else (cache_file or 'data.db'),
-                           base='.agora/store' if not cache_file else cache_base,
-                           path='',
-                           redis_host=cache_host or host,
-                           redis_db=cache_db,
-                           redis_port=cache_port or port)
+        cache = get_cache(cache_file, cache_host, cache_port, cache_db, memory_size=memory_cache)
     else:
         cache = None
 
+    set_concurrency(concurrency)
     click.echo('Discovering ecosystem...', nl=False)
     dgw = ctx.obj['gw'].data(query, cache=cache, lazy=False, host=host, port=port, base='.agora/store/fragments')
     click.echo('Done')
 
     server = ss(ctx.obj['gw'].agora, query_function=query_f(dgw, incremental, fragment_cache, ignore_cycles))
-    CORS(server)
+    CORS(instrument(ctx, server, metrics=metrics))
     server.run(host='0.0.0.0', port=port, threaded=True)
     click.echo()
 
@@ -161,7 +167,9 @@ def fragment_f(dgw, scholar, ignore_cycles):
     def wrapper(*args, **kwargs):
         kwargs['scholar'] = scholar
         kwargs['follow_cycles'] = not ignore_cycles
-        return dgw.fragment(*args, **kwargs)
+        fragment = dgw.fragment(*args, **kwargs)
+        fragment['generator'] = stream('triples', fragment['generator'])
+        return fragment
 
     return wrapper
 
@@ -175,36 +183,28 @@ def fragment_f(dgw, scholar, ignore_cycles):
 @click.option('--cache-db')
 @click.option('--resource-cache', is_flag=True, default=False)
 @click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
 @click.option('--host', default='agora')
 @click.option('--port', default=80)
+@click.option('--metrics', is_flag=True, default=False, help='Serve Prometheus metrics in /metrics')
 @click.pass_context
 def publish_fragment(ctx, query, ignore_cycles, cache_file, cache_host, cache_port, cache_db, resource_cache,
-                     fragment_cache, host,
-                     port):
+                     fragment_cache, memory_cache, concurrency, host, port, metrics):
     check_init(ctx)
 
-    if cache_file:
-        path_parts = cache_file.split('/')
-        cache_base = '/'.join(cache_file.split('/')[:-1])
-        cache_file = path_parts[-1]
-
     if resource_cache or fragment_cache:
-        remote_cache = all([cache_host, cache_port, cache_db])
-        cache = RedisCache(redis_file=None if remote_cache else (cache_file or 'data.db'),
-                           base='.agora/store' if not cache_file else cache_base,
-                           path='',
-                           redis_host=cache_host or host,
-                           redis_db=cache_db,
-                           redis_port=cache_port or port)
+        cache = get_cache(cache_file, cache_host, cache_port, cache_db, memory_size=memory_cache)
     else:
         cache = None
 
+    set_concurrency(concurrency)
     click.echo('Preparing...', nl=False)
     dgw = ctx.obj['gw'].data(query, cache=cache, lazy=False, host=host, port=port, base='.agora/store/fragments')
     click.echo('Ready')
 
     server = frs(ctx.obj['gw'].agora, fragment_function=fragment_f(dgw, fragment_cache, ignore_cycles))
-    CORS(server)
+    CORS(instrument(ctx, server, metrics=metrics))
     server.run(host='0.0.0.0', port=port, threaded=True)
     click.echo()
 
@@ -219,31 +219,22 @@ def publish_fragment(ctx, query, ignore_cycles, cache_file, cache_host, cache_po
 @click.option('--cache-db')
 @click.option('--resource-cache', is_flag=True, default=False)
 @click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
 @click.option('--host', default='agora')
 @click.option('--port', default=80)
+@click.option('--metrics', is_flag=True, default=False, help='Serve Prometheus metrics in /metrics')
 @click.pass_context
 def publish_ui(ctx, query, incremental, ignore_cycles, cache_file, cache_host, cache_port, cache_db, resource_cache,
-               fragment_cache,
-               host,
-               port):
+               fragment_cache, memory_cache, concurrency, host, port, metrics):
     check_init(ctx)
 
-    if cache_file:
-        path_parts = cache_file.split('/')
-        cache_base = '/'.join(cache_file.split('/')[:-1])
-        cache_file = path_parts[-1]
-
     if resource_cache or fragment_cache:
-        remote_cache = all([cache_host, cache_port, cache_db])
-        cache = RedisCache(redis_file=None if remote_cache else (cache_file or 'data.db'),
-                           base='.agora/store' if not cache_file else cache_base,
-                           path='',
-                           redis_host=cache_host,
-                           redis_db=cache_db,
-                           redis_port=cache_port)
+        cache = get_cache(cache_file, cache_host, cache_port, cache_db, memory_size=memory_cache)
     else:
         cache = None
 
+    set_concurrency(concurrency)
     click.echo('Discovering ecosystem...', nl=False)
     dgw = ctx.obj['gw'].data(query, cache=cache, lazy=False, host=host, port=80, base='.agora/store/fragments')
     click.echo('Done')
@@ -251,7 +242,7 @@ def publish_ui(ctx, query, incremental, ignore_cycles, cache_file, cache_host, c
     server = fs(ctx.obj['gw'].agora.fountain)
     frs(ctx.obj['gw'].agora, server=server, fragment_function=fragment_f(dgw, fragment_cache, ignore_cycles))
     ss(ctx.obj['gw'].agora, server=server, query_function=query_f(dgw, incremental, fragment_cache, ignore_cycles))
-    CORS(server)
+    CORS(instrument(ctx, server, metrics=metrics))
     server.run(host='0.0.0.0', port=port, threaded=True)
     click.echo()
 
@@ -265,33 +256,26 @@ def publish_ui(ctx, query, incremental, ignore_cycles, cache_file, cache_host, c
 @click.option('--cache-db')
 @click.option('--resource-cache', is_flag=True, default=False)
 @click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
 @click.option('--age-gql-cache', type=int, default=300)
 @click.option('--len-gql-cache', type=int, default=1000000)
 @click.option('--host', default='agora')
 @click.option('--port', default=80)
+@click.option('--metrics', is_flag=True, default=False, help='Serve Prometheus metrics in /metrics')
 @click.pass_context
 def publish_gql(ctx, schema_file, ignore_cycles, cache_file, cache_host, cache_port, cache_db, resource_cache,
-                fragment_cache, age_gql_cache, len_gql_cache, host, port):
+                fragment_cache, memory_cache, concurrency, age_gql_cache, len_gql_cache, host, port, metrics):
     check_init(ctx)
 
-    if cache_file:
-        path_parts = cache_file.split('/')
-        cache_base = '/'.join(cache_file.split('/')[:-1])
-        cache_file = path_parts[-1]
-
     if resource_cache or fragment_cache:
-        remote_cache = all([cache_host, cache_port, cache_db])
-        cache = RedisCache(redis_file=None if remote_cache else (cache_file or 'data.db'),
-                           base='.agora/store' if not cache_file else cache_base,
-                           path='',
-                           redis_host=cache_host,
-                           redis_db=cache_db,
-                           redis_port=cache_port)
+        cache = get_cache(cache_file, cache_host, cache_port, cache_db, memory_size=memory_cache)
     else:
         cache = None
 
+    set_concurrency(concurrency)
     app = Flask(__name__)
-    CORS(app)
+    CORS(instrument(ctx, app, metrics=metrics))
 
     ctx.obj['gw'].data_cache = cache
     gql_processor = GraphQLProcessor(ctx.obj['gw'], schema_path=schema_file, scholar=fragment_cache, host=host,
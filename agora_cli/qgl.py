@@ -18,9 +18,10 @@
 """
 
 import click
-from agora import RedisCache
 from agora_graphql.gql import GraphQLProcessor
 
+from agora_cli.cache import MEMORY_CACHE_SIZE, get_cache
+from agora_cli.loader import CONCURRENCY, set_concurrency
 from agora_cli.root import cli
 from agora_cli.utils import check_init, jsonify
 
@@ -43,30 +44,22 @@ def gql(ctx):
 @click.option('--cache-db')
 @click.option('--resource-cache', is_flag=True, default=False)
 @click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
 @click.option('--host', default='agora')
 @click.option('--port', default=80)
 @click.pass_context
 def query(ctx, q, schema_file, ignore_cycles, cache_file, cache_host, cache_port, cache_db, resource_cache,
-          fragment_cache, host, port):
+          fragment_cache, memory_cache, concurrency, host, port):
     check_init(ctx)
 
     q = q.replace("'", '"')
-    if cache_file:
-        path_parts = cache_file.split('/')
-        cache_base = '/'.join(cache_file.split('/')[:-1])
-        cache_file = path_parts[-1]
-
     if resource_cache or fragment_cache:
-        remote_cache = all([cache_host, cache_port, cache_db])
-        cache = RedisCache(redis_file=None if remote_cache else (cache_file or 'data.db'),
-                           base='.agora/store' if not cache_file else cache_base,
-                           path='',
-                           redis_host=cache_host,
-                           redis_db=cache_db,
-                           redis_port=cache_port)
+        cache = get_cache(cache_file, cache_host, cache_port, cache_db, memory_size=memory_cache)
     else:
         cache = None
 
+    set_concurrency(concurrency)
     ctx.obj['gw'].data_cache = cache
     processor = GraphQLProcessor(ctx.obj['gw'], schema_path=schema_file, scholar=fragment_cache, host=host,
                                  port=port, follow_cycles=not ignore_cycles, base='.agora/store/fragments')
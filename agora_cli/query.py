@@ -17,17 +17,23 @@
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
 """
 import json
-from Queue import Empty, Queue
 from datetime import datetime
 from threading import Thread
 
 import click
-from agora import RedisCache
 from agora.engine.utils import Semaphore
 from rdflib import URIRef, BNode
+from rdflib.query import ResultRow
 
+from agora_cli.cache import MEMORY_CACHE_SIZE, get_cache
+from agora_cli.hosts import get_hosts
+from agora_cli.loader import CONCURRENCY, set_concurrency
 from agora_cli.root import cli
-from agora_cli.utils import split_arg, check_init
+from agora_cli.stream import BUFFER_ROWS, BUFFER_BYTES, ChunkBuffer, StreamQueue, StreamAborted, gen_queue, \
+    write_chunks
+from agora_cli.terms import nt_term, term_key
+from agora_cli.timing import split
+from agora_cli.utils import split_arg, check_init, jsonify
 
 __author__ = 'Fernando Serena'
 
@@ -65,42 +71,134 @@ def result(row):
     return {l: r_dict(l) for l in row.labels if row[l] is not None}
 
 
-def gen_thread(status, queue, gen):
-    first = True
-    try:
-        for row in gen:
-            if first:
-                queue.put(u'{\n')
-                queue.put(u'  "head": %s,\n  "results": {\n    "bindings": [\n' % json.dumps(head(row)))
-                first = False
-            else:
-                queue.put(',\n')
-            queue.put(u'      {}'.format(json.dumps(result(row), ensure_ascii=False)))
-        if first:
-            queue.put('{\n')
-            queue.put('  "head": [],\n  "results": {\n    "bindings": []\n  }\n')
+class RowEncoder(object):
+    """
+    SPARQL JSON encoder for the bindings of rows with the given variables. It is compiled once per result set
+    and keeps the encoding of the last cache_size distinct terms, as URIs and typed values repeat a lot.
+    """
+
+    def __init__(self, labels, cache_size=1 << 16):
+        self.labels = [(l, u'{}: '.format(json.dumps(l))) for l in labels]
+        self.cache_size = cache_size
+        self.__terms = {}
+
+    def term(self, value):
+        type = value_type(value)
+        value_p = value.toPython()
+        if isinstance(value_p, datetime):
+            value_p = str(value_p)
+        enc = u'{{"type": "{}", "value": {}'.format(type, json.dumps(value_p, ensure_ascii=False))
+        if 'literal' in type:
+            if value.datatype:
+                enc += u', "datatype": {}'.format(json.dumps(value.datatype.toPython(), ensure_ascii=False))
+            if value.language:
+                enc += u', "xml:lang": {}'.format(json.dumps(str(value.language)))
+        enc += u'}'
+
+        if len(self.__terms) >= self.cache_size:
+            self.__terms.clear()
+        self.__terms[term_key(value)] = enc
+        return enc
+
+    def encode(self, row):
+        terms = self.__terms
+        parts = []
+        for label, key in self.labels:
+            value = row[label]
+            if value is not None:
+                enc = terms.get(term_key(value))
+                if enc is None:
+                    enc = self.term(value)
+                parts.append(key + enc)
+        return u'{' + u', '.join(parts) + u'}'
+
+
+def csv_value(value):
+    if value is None:
+        return u''
+    if isinstance(value, BNode):
+        value = u'_:' + value
+    if any(c in value for c in u'",\r\n'):
+        return u'"{}"'.format(value.replace(u'"', u'""'))
+    return unicode(value)
+
+
+def tsv_value(value):
+    if value is None:
+        return u''
+    return nt_term(value)
+
+
+def write_json(out, gen):
+    encoder = None
+    for row in gen:
+        if encoder is None:
+            out.write(u'{\n')
+            out.write(u'  "head": %s,\n  "results": {\n    "bindings": [\n' % json.dumps(head(row)))
+            encoder = RowEncoder(head(row)['vars'])
         else:
-            queue.put('\n    ]\n  }\n')
-        queue.put('}')
-    except Exception, e:
-        exception = e
-        print e.message
+            out.write(u',\n')
+        out.write(u'      ' + encoder.encode(row), rows=1)
+    if encoder is None:
+        out.write(u'{\n')
+        out.write(u'  "head": [],\n  "results": {\n    "bindings": []\n  }\n')
+    else:
+        out.write(u'\n    ]\n  }\n')
+    out.write(u'}\n')
+
+
+def write_ndjson(out, gen):
+    encoder = None
+    for row in gen:
+        if encoder is None:
+            encoder = RowEncoder(head(row)['vars'])
+        out.write(encoder.encode(row) + u'\n', rows=1)
+
+
+def write_separated(sep, eol, header, value):
+    def writer(out, gen):
+        labels = None
+        for row in gen:
+            if labels is None:
+                labels = head(row)['vars']
+                out.write(sep.join(map(header, labels)) + eol)
+            out.write(sep.join([value(row[l]) for l in labels]) + eol, rows=1)
+
+    return writer
 
-    status['completed'] = True
 
+WRITERS = {
+    'json': write_json,
+    'ndjson': write_ndjson,
+    'csv': write_separated(u',', u'\r\n', csv_value, csv_value),
+    'tsv': write_separated(u'\t', u'\n', lambda l: u'?' + l, tsv_value)
+}
 
-def gen_queue(status, stop_event, queue):
-    with stop_event:
-        while not status['completed'] or not queue.empty():
-            status['last'] = datetime.now()
-            try:
-                for chunk in queue.get(timeout=1.0):
-                    yield chunk
-            except Empty:
-                if not status['completed']:
-                    pass
-                elif status['exception']:
-                    raise Exception(status['exception'].message)
+
+def result_rows(result):
+    """
+    Rows of a SELECT result as they are generated. Iterating the result itself keeps every binding in it.
+    """
+    bindings = getattr(result, '_genbindings', None)
+    if getattr(result, 'type', None) != 'SELECT' or not bindings:
+        return iter(result)
+    result._genbindings = None
+    return (ResultRow(b, result.vars) for b in bindings)
+
+
+def gen_thread(status, queue, gen, format='json'):
+    out = ChunkBuffer.for_queue(queue)
+    try:
+        with split(result_rows(gen)) as rows:
+            WRITERS[format](out, rows)
+    except StreamAborted:
+        pass
+    except Exception as e:
+        status['exception'] = e
+    finally:
+        out.close()
+
+    status['completed'] = True
 
 
 @cli.command('query')
@@ -114,33 +212,31 @@ def gen_queue(status, stop_event, queue):
 @click.option('--cache-db')
 @click.option('--resource-cache', is_flag=True, default=False)
 @click.option('--fragment-cache', is_flag=True, default=False)
+@click.option('--memory-cache', type=int, default=MEMORY_CACHE_SIZE)
+@click.option('--concurrency', type=int, default=CONCURRENCY)
 @click.option('--host', default='agora')
 @click.option('--port', default=80)
+@click.option('--buffer-rows', type=int, default=BUFFER_ROWS)
+@click.option('--buffer-bytes', type=int, default=BUFFER_BYTES)
+@click.option('--buffer-stats', is_flag=True, default=False)
+@click.option('--host-stats', is_flag=True, default=False)
+@click.option('--format', type=click.Choice(sorted(WRITERS)), default='json')
 @click.pass_context
 def query(ctx, q, arg, incremental, ignore_cycles, cache_file, cache_host, cache_port, cache_db, resource_cache,
-          fragment_cache, host, port):
+          fragment_cache, memory_cache, concurrency, host, port, buffer_rows, buffer_bytes, buffer_stats, host_stats,
+          format):
     check_init(ctx)
 
     args = dict(map(lambda a: split_arg(a), arg))
 
-    if cache_file:
-        path_parts = cache_file.split('/')
-        cache_base = '/'.join(cache_file.split('/')[:-1])
-        cache_file = path_parts[-1]
-
     if resource_cache or fragment_cache:
-        remote_cache = all([cache_host, cache_port, cache_db])
-        cache = RedisCache(redis_file=None if remote_cache else (cache_file or 'data.db'),
-                           base='.agora/store' if not cache_file else cache_base,
-                           path='',
-                           redis_host=cache_host,
-                           redis_db=cache_db,
-                           redis_port=cache_port)
+        cache = get_cache(cache_file, cache_host, cache_port, cache_db, memory_size=memory_cache)
     else:
         cache = None
     stop = Semaphore()
-    queue = Queue()
+    queue = StreamQueue(max_rows=buffer_rows, max_bytes=buffer_bytes)
 
+    set_concurrency(concurrency)
     dgw = ctx.obj['gw'].data(q, cache=cache, lazy=False, host=host, port=port, base='.agora/store/fragments')
     gen = dgw.query(q, incremental=incremental, stop_event=stop, scholar=fragment_cache, follow_cycles=not ignore_cycles,
                     **args)
@@ -149,11 +245,12 @@ def query(ctx, q, arg, incremental, ignore_cycles, cache_file, cache_host, cache
         'completed': False,
         'exception': None
     }
-    stream_th = Thread(target=gen_thread, args=(request_status, queue, gen))
+    stream_th = Thread(target=gen_thread, args=(request_status, queue, gen, format))
     stream_th.daemon = False
     stream_th.start()
 
-    for chunk in gen_queue(request_status, stop, queue):
-        click.echo(chunk, nl=False)
-
-    click.echo()
+    write_chunks(gen_queue(request_status, stop, queue))
+    if buffer_stats:
+        click.echo(jsonify(queue.stats), err=True)
+    if host_stats:
+        click.echo(jsonify(get_hosts().stats), err=True)
@@ -16,13 +16,19 @@
   limitations under the License.
 #-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
 """
+import json
 import logging
+import os.path as path
+import sys
+import time
+from importlib import import_module
 
 import click
-from agora import setup_logging, Agora
-from agora_gw import Gateway
 
-from agora_cli.utils import load_config, mute_logger, load_host_replacements
+from agora_cli.paths import index_paths
+from agora_cli.plans import cache_plans
+from agora_cli.timing import Profiler, phase, time_planner, timings
+from agora_cli.utils import load_config, mute_logger, load_host_replacements, load_host_limits, jsonify
 
 __author__ = 'Fernando Serena'
 
@@ -30,27 +36,185 @@ mute_logger('jsonpath_ng')
 mute_logger('rdflib')
 mute_logger('agora')
 
+# Top-level commands and the modules that register them. Modules are only imported when their command
+# is invoked (or listed), so the heavy Agora, Flask and GraphQL stacks are not loaded by every call.
+COMMANDS = {
+    'add': 'agora_cli.add',
+    'bench': 'agora_cli.bench',
+    'cache': 'agora_cli.cache',
+    'compute': 'agora_cli.compute',
+    'daemon': 'agora_cli.daemon',
+    'delete': 'agora_cli.delete',
+    'discover': 'agora_cli.discover',
+    'export': 'agora_cli.export',
+    'get': 'agora_cli.get',
+    'gql': 'agora_cli.qgl',
+    'import': 'agora_cli.export',
+    'init': 'agora_cli.init',
+    'learn': 'agora_cli.learn',
+    'list': 'agora_cli.list',
+    'publish': 'agora_cli.publish',
+    'query': 'agora_cli.query',
+    'show': 'agora_cli.show',
+}
+
+
+def version():
+    with open(path.join(path.dirname(__file__), 'metadata.json'), 'r') as f:
+        return json.load(f)['version']
+
+
+class LazyGroup(click.Group):
+    def __init__(self, name=None, commands=None, lazy_commands=None, **attrs):
+        super(LazyGroup, self).__init__(name, commands, **attrs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(self.commands).union(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            import_module(self.lazy_commands[cmd_name])
+        return self.commands.get(cmd_name)
+
+
+class AgoraGroup(LazyGroup):
+    def main(self, args=None, **extra):
+        if args is None:
+            args = sys.argv[1:]
+        if extra.get('standalone_mode', True):
+            from agora_cli.daemon import forward
+
+            code = forward(args)
+            if code is not None:
+                sys.exit(code)
+        return super(AgoraGroup, self).main(args, **extra)
+
+
+class LazyGateway(object):
+    """
+    Stands in for an agora_gw Gateway that is only built on first use. Commands that just need the fountain
+    (types, properties, prefixes, paths) get a standalone Agora engine, so the TED repository and its caches
+    are left closed; any other attribute builds the whole Gateway.
+    """
+
+    def __init__(self, config):
+        self.__config = config
+        self.__gw = None
+        self.__agora = None
+
+    @property
+    def loaded(self):
+        return self.__gw is not None or self.__agora is not None
+
+    @property
+    def gateway(self):
+        if self.__gw is None:
+            from agora_gw import Gateway
+
+            if self.__agora is not None:
+                # The Gateway opens its own engine on the same fountain store
+                self.__agora.shutdown()
+                self.__agora = None
+            with phase('gateway'):
+                self.__gw = Gateway(**self.__config)
+            time_planner(cache_plans(index_paths(self.__gw.agora)))
+        return self.__gw
+
+    @property
+    def agora(self):
+        if self.__gw is None and 'host' not in self.__config:
+            if self.__agora is None:
+                from agora import Agora
+
+                with phase('gateway'):
+                    self.__agora = Agora(**self.__config.get('engine', {}))
+                time_planner(cache_plans(index_paths(self.__agora)))
+            return self.__agora
+        return self.gateway.agora
+
+    @property
+    def data_cache(self):
+        return self.gateway.data_cache
+
+    @data_cache.setter
+    def data_cache(self, c):
+        self.gateway.data_cache = c
+
+    def data(self, query, cache=None, **kwargs):
+        from agora_cli.loader import install_loader
+
+        gateway = self.gateway
+        with phase('discovery'):
+            dgw = gateway.data(query, cache=cache, **kwargs)
+        install_loader(dgw.ted, cache.r if cache is not None else None)
+        return dgw
+
+    def __getattr__(self, item):
+        return getattr(self.gateway, item)
+
+    def close(self):
+        if self.__gw is not None:
+            self.__gw.close()
+        elif self.__agora is not None:
+            self.__agora.shutdown()
+
 
 def close(gw):
-    gw.close()
-    Agora.close()
+    if gw.loaded:
+        from agora import Agora
 
+        gw.close()
+        Agora.close()
 
-@click.group()
+
+def measure(ctx, profile, show_timings):
+    """
+    Profiles and/or times the whole invocation, reporting when its context is closed.
+    """
+    start = time.time()
+    timings.enabled = True
+    profiler = Profiler(profile) if profile else None
+    if profiler is not None:
+        profiler.enable()
+
+    def report():
+        if profiler is not None:
+            profiler.dump()
+        if show_timings:
+            click.echo(jsonify({'total': round(time.time() - start, 4), 'phases': timings.summary()}), err=True)
+
+    ctx.call_on_close(report)
+    return profiler
+
+
+@click.group(cls=AgoraGroup, lazy_commands=COMMANDS)
 @click.option('--debug', is_flag=True, default=False)
 @click.option('--gw-host')
 @click.option('--gw-port')
-@click.version_option()
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), help='Write a cProfile stats file')
+@click.option('--timings', 'show_timings', is_flag=True, default=False,
+              help='Print the time spent in every phase to stderr')
+@click.version_option(version=version())
 @click.pass_context
-def cli(ctx, debug, gw_host, gw_port):
+def cli(ctx, debug, gw_host, gw_port, profile, show_timings):
+    profiler = None
+    if profile or show_timings:
+        profiler = measure(ctx, profile, show_timings)
+
     if gw_host and gw_port:
         config = {'host': gw_host, 'port': gw_port}
     else:
         config = load_config()
     if config is not None:
         if debug:
+            from agora import setup_logging
+
             setup_logging(logging.DEBUG)
 
-        gw = Gateway(**config)
-        ctx.call_on_close(lambda: close(gw))
-        ctx.obj = {'gw': gw, 'config': config, 'repls': load_host_replacements()}
+        gw = ctx.obj.get('gw') if ctx.obj else None
+        if gw is None:
+            gw = LazyGateway(config)
+            ctx.call_on_close(lambda: close(gw))
+        ctx.obj = {'gw': gw, 'config': config, 'repls': load_host_replacements(), 'limits': load_host_limits(),
+                   'profiler': profiler}
@@ -18,7 +18,6 @@
 """
 
 import click
-from agora_gw.gateway import NotFoundError, GatewayError
 
 from agora_cli.root import cli
 from agora_cli.utils import jsonify, show_ted, show_td, show_thing, check_init, load_config, error
@@ -36,6 +35,8 @@ def show(ctx):
 @click.pass_context
 @click.argument('name')
 def show_extension(ctx, name):
+    from agora_gw.gateway import NotFoundError
+
     gw = ctx.obj['gw']
     try:
         g = gw.get_extension(name)
@@ -55,6 +56,8 @@ def show_prefixes(ctx):
 @click.pass_context
 @click.argument('name')
 def show_type(ctx, name):
+    from agora_gw.gateway import NotFoundError
+
     gw = ctx.obj['gw']
     try:
         click.echo(jsonify(gw.get_type(name)))
@@ -66,6 +69,8 @@ def show_type(ctx, name):
 @click.pass_context
 @click.argument('name')
 def show_property(ctx, name):
+    from agora_gw.gateway import NotFoundError
+
     gw = ctx.obj['gw']
     try:
         click.echo(jsonify(gw.get_property(name)))
@@ -77,12 +82,20 @@ def show_property(ctx, name):
 @click.pass_context
 @click.argument('source')
 @click.argument('dest')
-def show_paths(ctx, source, dest):
+@click.option('--shortest', is_flag=True, default=False, help='Only the paths with the fewest steps')
+def show_paths(ctx, source, dest, shortest):
+    from agora_cli.paths import get_path_index
+
     gw = ctx.obj['gw']
+    force_seed = [('<{}-uri>'.format(source.lower()).replace(':', '-'), source)]
     try:
-        click.echo(jsonify(
-            gw.agora.fountain.get_paths(dest,
-                                        force_seed=[('<{}-uri>'.format(source.lower()).replace(':', '-'), source)])))
+        paths = get_path_index().paths(dest, force_seed=force_seed, shortest=shortest)
+        if paths is None:
+            paths = gw.agora.fountain.get_paths(dest, force_seed=force_seed)
+            if shortest and paths['paths']:
+                hops = min([len(p['steps']) for p in paths['paths']])
+                paths['paths'] = filter(lambda p: len(p['steps']) == hops, paths['paths'])
+        click.echo(jsonify(paths))
     except TypeError:
         error('Source and/or destination are unknown')
 
@@ -91,6 +104,8 @@ def show_paths(ctx, source, dest):
 @click.pass_context
 @click.option('--turtle', default=False, is_flag=True)
 def _show_ted(ctx, turtle):
+    from agora_gw.gateway import GatewayError
+
     try:
         ted = ctx.obj['gw'].ted
         show_ted(ted, format='text/turtle' if turtle else 'application/ld+json')
@@ -103,6 +118,8 @@ def _show_ted(ctx, turtle):
 @click.option('--turtle', default=False, is_flag=True)
 @click.pass_context
 def _show_td(ctx, id, turtle):
+    from agora_gw.gateway import NotFoundError
+
     try:
         td = ctx.obj['gw'].get_description(id)
         show_td(td, format='text/turtle' if turtle else 'application/ld+json')
@@ -115,6 +132,8 @@ def _show_td(ctx, id, turtle):
 @click.option('--turtle', default=False, is_flag=True)
 @click.pass_context
 def _show_resource(ctx, id, turtle):
+    from agora_gw.gateway import NotFoundError
+
     try:
         g = ctx.obj['gw'].get_resource(id).to_graph()
         show_thing(g, format='text/turtle' if turtle else 'application/ld+json')
@@ -127,6 +146,8 @@ def _show_resource(ctx, id, turtle):
 @click.option('--turtle', default=False, is_flag=True)
 @click.pass_context
 def _show_enrichment(ctx, id, turtle):
+    from agora_gw.gateway import NotFoundError
+
     try:
         g = ctx.obj['gw'].get_enrichment(id).to_graph()
         show_thing(g, format='text/turtle' if turtle else 'application/ld+json')
@@ -139,6 +160,8 @@ def _show_enrichment(ctx, id, turtle):
 @click.option('--turtle', default=False, is_flag=True)
 @click.pass_context
 def _show_thing(ctx, id, turtle):
+    from agora_gw.gateway import NotFoundError
+
     try:
         g = ctx.obj['gw'].get_thing(id).to_graph()
         show_thing(g, format='text/turtle' if turtle else 'application/ld+json')
@@ -157,3 +180,22 @@ def show_args(ctx):
 @click.pass_context
 def show_config(ctx):
     click.echo(jsonify(load_config()))
+
+
+@show.command('cache')
+@click.option('--cache-file')
+@click.option('--cache-host')
+@click.option('--cache-port')
+@click.option('--cache-db')
+@click.option('--top', type=int, default=10)
+@click.pass_context
+def show_cache(ctx, cache_file, cache_host, cache_port, cache_db, top):
+    from agora_cli.cache import GIDS_KEY, get_cache_kv, inspect_kv, inspect_fragments, inspect_compression, live_stats
+
+    kv = get_cache_kv(cache_file, cache_host, cache_port, cache_db)
+    report = inspect_kv(kv)
+    report['resources'] = kv.hlen(GIDS_KEY)
+    report['fragments'] = inspect_fragments(top=top)
+    report['compression'] = inspect_compression(kv)
+    report['live'] = live_stats(kv)
+    click.echo(jsonify(report))
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+from Queue import Empty
+from collections import deque
+from datetime import datetime
+from threading import Condition
+
+import click
+
+__author__ = 'Fernando Serena'
+
+CHUNK_SIZE = 1 << 16
+BUFFER_ROWS = 10000
+BUFFER_BYTES = 1 << 24
+
+
+class StreamAborted(Exception):
+    pass
+
+
+class StreamQueue(object):
+    """
+    Chunk queue between a stream producer and its consumer, bounded by the number of rows and bytes it holds.
+    Producers block in put while it is full (a single chunk is always accepted), and get StreamAborted once the
+    consumer has closed it.
+    """
+
+    def __init__(self, max_rows=BUFFER_ROWS, max_bytes=BUFFER_BYTES):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.__chunks = deque()
+        self.__cond = Condition()
+        self.__rows = 0
+        self.__bytes = 0
+        self.__peak_rows = 0
+        self.__peak_bytes = 0
+        self.__closed = False
+
+    def __full(self, rows, size):
+        if not self.__chunks:
+            return False
+        return (self.max_rows and self.__rows + rows > self.max_rows) or (
+            self.max_bytes and self.__bytes + size > self.max_bytes)
+
+    def put(self, chunk, rows=0):
+        with self.__cond:
+            while not self.__closed and self.__full(rows, len(chunk)):
+                self.__cond.wait(1.0)
+            if self.__closed:
+                raise StreamAborted()
+            self.__chunks.append((chunk, rows))
+            self.__rows += rows
+            self.__bytes += len(chunk)
+            self.__peak_rows = max(self.__peak_rows, self.__rows)
+            self.__peak_bytes = max(self.__peak_bytes, self.__bytes)
+            self.__cond.notify_all()
+
+    def get(self, timeout=None):
+        with self.__cond:
+            if not self.__chunks:
+                self.__cond.wait(timeout)
+                if not self.__chunks:
+                    raise Empty()
+            chunk, rows = self.__chunks.popleft()
+            self.__rows -= rows
+            self.__bytes -= len(chunk)
+            self.__cond.notify_all()
+            return chunk
+
+    def empty(self):
+        with self.__cond:
+            return not self.__chunks
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+    @property
+    def stats(self):
+        return {
+            'max_rows': self.max_rows,
+            'max_bytes': self.max_bytes,
+            'peak_rows': self.__peak_rows,
+            'peak_bytes': self.__peak_bytes
+        }
+
+
+class ChunkBuffer(object):
+    """
+    Accumulates the text pieces written by a stream producer and hands them to put as utf-8 chunks of
+    roughly size bytes (or rows rows), so consumers deal with a few large writes instead of one per row or term.
+    """
+
+    def __init__(self, put, size=CHUNK_SIZE, rows=None):
+        self.put = put
+        self.size = size
+        self.rows = rows
+        self.__pieces = []
+        self.__length = 0
+        self.__rows = 0
+
+    @classmethod
+    def for_queue(cls, queue):
+        return cls(queue.put, size=min(CHUNK_SIZE, queue.max_bytes or CHUNK_SIZE), rows=queue.max_rows)
+
+    def write(self, piece, rows=0):
+        self.__pieces.append(piece)
+        self.__length += len(piece)
+        self.__rows += rows
+        if self.__length >= self.size or (self.rows and self.__rows >= self.rows):
+            self.flush()
+
+    def flush(self):
+        if self.__pieces:
+            chunk = u''.join(self.__pieces).encode('utf-8')
+            rows = self.__rows
+            self.__pieces = []
+            self.__length = 0
+            self.__rows = 0
+            self.put(chunk, rows)
+
+    def close(self):
+        try:
+            self.flush()
+        except StreamAborted:
+            pass
+
+
+def gen_queue(status, stop_event, queue):
+    with stop_event:
+        try:
+            while not status['completed'] or not queue.empty():
+                status['last'] = datetime.now()
+                try:
+                    yield queue.get(timeout=1.0)
+                except Empty:
+                    pass
+        finally:
+            # Unblocks the producer if the consumer went away
+            queue.close()
+
+    if status['exception']:
+        raise Exception(status['exception'].message)
+
+
+def write_chunks(chunks, out=None):
+    if out is None:
+        out = click.get_binary_stream('stdout')
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+        out.flush()
+    finally:
+        chunks.close()
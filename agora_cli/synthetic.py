@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import json
+import zlib
+from urlparse import urlparse
+
+__author__ = 'Fernando Serena'
+
+NAMESPACE = 'http://bench.agora/ns#'
+PREFIX = 'bench'
+DOMAIN = 'bench.agora'
+MEDIA = 'application/json'
+SPEC_FILE = 'synthetic.json'
+
+OWL = 'http://www.w3.org/2002/07/owl#'
+RDFS = 'http://www.w3.org/2000/01/rdf-schema#'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+CORE = 'http://iot.linkeddata.es/def/core#'
+MAP = 'http://iot.linkeddata.es/def/wot-mappings#'
+WOT = 'http://iot.linkeddata.es/def/wot#'
+
+
+class Synthetic(object):
+    """
+    Parameterized Thing ecosystem: things root resources of type T0, each linking fanout resources of type T1, each
+    of them fanout of type T2 and so on up to types levels, all with properties literals. Roots are spread over
+    hosts; every other type is served by one parameterized TD. Resources are JSON documents that are generated on
+    demand from their path, so no resource is ever stored.
+    """
+
+    def __init__(self, things=1000, types=3, properties=4, fanout=10, hosts=4, namespace=NAMESPACE, domain=DOMAIN):
+        self.things = things
+        self.types = types
+        self.properties = properties
+        self.fanout = fanout
+        self.hosts = hosts
+        self.namespace = namespace
+        self.domain = domain
+
+    @staticmethod
+    def load(file_path):
+        with open(file_path) as f:
+            return Synthetic(**json.load(f))
+
+    def dump(self, file_path):
+        with open(file_path, 'w') as f:
+            json.dump(self.spec, f, indent=3, sort_keys=True)
+
+    @property
+    def spec(self):
+        return {
+            'things': self.things,
+            'types': self.types,
+            'properties': self.properties,
+            'fanout': self.fanout,
+            'hosts': self.hosts,
+            'namespace': self.namespace,
+            'domain': self.domain
+        }
+
+    @property
+    def resources(self):
+        return self.things * sum([self.fanout ** level for level in range(self.types)])
+
+    def host(self, i):
+        return 'api{}.{}'.format(i % self.hosts, self.domain)
+
+    @property
+    def bases(self):
+        return sorted(set(['http://{}/'.format(self.host(i)) for i in range(max(self.hosts, self.types))]))
+
+    def thing_href(self, n):
+        return 'http://{}/things/{}'.format(self.host(n), n)
+
+    def type_href(self, level, item='$item'):
+        return 'http://{}/t{}/{}'.format(self.host(level), level, item)
+
+    def term(self, name):
+        return '<{}{}>'.format(self.namespace, name)
+
+    def document(self, uri):
+        """
+        Returns the JSON document of the resource at uri, or None if it is not part of the ecosystem.
+        """
+        parts = urlparse(uri)
+        segments = parts.path.strip('/').split('/')
+        if len(segments) != 2 or parts.query:
+            return None
+        kind, id = segments
+        try:
+            path = map(int, id.split('-'))
+        except ValueError:
+            return None
+
+        level = len(path) - 1
+        if kind == 'things':
+            if level or parts.netloc != self.host(path[0]):
+                return None
+        elif kind != 't{}'.format(level) or not level or parts.netloc != self.host(level):
+            return None
+        if level >= self.types or not 0 <= path[0] < self.things or any([not 0 <= k < self.fanout for k in path[1:]]):
+            return None
+
+        doc = {'id': id}
+        for j in range(self.properties):
+            if j % 2:
+                doc['p{}'.format(j)] = zlib.crc32('{}:{}'.format(id, j)) & 0xffff
+            else:
+                doc['p{}'.format(j)] = 't{}p{} {}'.format(level, j, id)
+        if level < self.types - 1:
+            doc['links'] = ['{}-{}'.format(id, k) for k in range(self.fanout)]
+        return doc
+
+    def write_extension(self, f):
+        # Agora drops the prefixes rdflib makes up, and plans no query on terms of a namespace without a prefix.
+        # Learned as an extension named after the prefix, the gateway declares the namespace as the ontology too.
+        f.write('@prefix owl: <{}> .\n@prefix rdfs: <{}> .\n@prefix xsd: <{}> .\n@prefix {}: <{}> .\n\n'.format(
+            OWL, RDFS, XSD, PREFIX, self.namespace))
+        f.write('<{}> a owl:Ontology .\n'.format(self.namespace))
+        for level in range(self.types):
+            t = self.term('T{}'.format(level))
+            f.write('\n{} a owl:Class .\n'.format(t))
+            for j in range(self.properties):
+                f.write('{} a owl:DatatypeProperty ; rdfs:domain {} ; rdfs:range xsd:{} .\n'.format(
+                    self.term('t{}p{}'.format(level, j)), t, 'integer' if j % 2 else 'string'))
+            if level < self.types - 1:
+                f.write('{} a owl:ObjectProperty ; rdfs:domain {} ; rdfs:range {} .\n'.format(
+                    self.term('t{}link'.format(level)), t, self.term('T{}'.format(level + 1))))
+
+    def __write_mappings(self, f, node, level):
+        for j in range(self.properties):
+            f.write('_:{0}m{1} a map:Mapping ; map:predicate {2} ; map:key "p{1}" ; map:targetDatatype xsd:{3} .\n'
+                    .format(node, j, self.term('t{}p{}'.format(level, j)), 'integer' if j % 2 else 'string'))
+            f.write('_:{0}am map:hasMapping _:{0}m{1} .\n'.format(node, j))
+        if level < self.types - 1:
+            f.write('_:{0}ml a map:Mapping ; map:predicate {1} ; map:key "links" ; map:targetClass {2} ; '
+                    'map:valuesTransformedBy _:t{3}td .\n'.format(node, self.term('t{}link'.format(level)),
+                                                                   self.term('T{}'.format(level + 1)), level + 1))
+            f.write('_:{0}am map:hasMapping _:{0}ml .\n'.format(node))
+
+    def __write_td(self, f, node, id, level, href):
+        f.write('\n_:{0}td a core:ThingDescription ; core:identifier "{1}" ; core:describes _:{0} ; '
+                'map:hasAccessMapping _:{0}am .\n'.format(node, id))
+        f.write('_:{} a {} .\n'.format(node, self.term('T{}'.format(level))))
+        f.write('_:{0}am a map:AccessMapping ; map:mapsResourcesFrom _:{0}e .\n'.format(node))
+        f.write('_:{}e a wot:Link ; wot:href "{}" ; wot:mediaType "{}" .\n'.format(node, href, MEDIA))
+        self.__write_mappings(f, node, level)
+
+    def write_ted(self, f):
+        f.write('@prefix core: <{}> .\n@prefix map: <{}> .\n@prefix wot: <{}> .\n@prefix xsd: <{}> .\n\n'.format(
+            CORE, MAP, WOT, XSD))
+        f.write('_:ted a core:ThingEcosystemDescription ; core:describes _:eco .\n_:eco a core:Ecosystem .\n')
+        for n in range(self.things):
+            f.write('_:eco core:hasComponent _:th{} .\n'.format(n))
+            self.__write_td(f, 'th{}'.format(n), 'thing-{}'.format(n), 0, self.thing_href(n))
+        for level in range(1, self.types):
+            self.__write_td(f, 't{}'.format(level), 't{}'.format(level), level, self.type_href(level))
+
+    def queries(self):
+        """
+        SPARQL queries that go one type deeper each: the properties of the roots, of the resources they link...
+        """
+        queries = []
+        for depth in range(self.types):
+            patterns = ['?r0 a {}'.format(self.term('T0'))]
+            for level in range(depth):
+                patterns.append('?r{} {} ?r{}'.format(level, self.term('t{}link'.format(level)), level + 1))
+            patterns.append('?r{0} {1} ?v'.format(depth, self.term('t{}p0'.format(depth))))
+            queries.append('SELECT * WHERE {{\n  {}\n}}'.format(' .\n  '.join(patterns)))
+        return queries
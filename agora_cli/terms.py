@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+from rdflib import Literal
+
+__author__ = 'Fernando Serena'
+
+TERM_CACHE_SIZE = 1 << 16
+
+
+def nt_term(term):
+    """
+    N-Triples encoding of an RDF term. Unlike Literal.n3(), literals are always written in a single line.
+    """
+    if isinstance(term, Literal):
+        lexical = term.replace(u'\\', u'\\\\').replace(u'"', u'\\"').replace(u'\n', u'\\n').replace(u'\r', u'\\r') \
+            .replace(u'\t', u'\\t')
+        if term.language:
+            return u'"{}"@{}'.format(lexical, term.language)
+        if term.datatype:
+            return u'"{}"^^<{}>'.format(lexical, term.datatype)
+        return u'"{}"'.format(lexical)
+    return term.n3()
+
+
+def term_key(term):
+    # Literals compare equal regardless of their lexical form or the case of their language tag, which are kept in
+    # the output
+    return type(term), unicode(term), getattr(term, 'language', None), getattr(term, 'datatype', None)
+
+
+class TermCache(object):
+    """
+    Bounded cache of term serializations. Subjects and predicates repeat heavily in fragments, and serializing
+    them against a namespace manager means computing a qname every time. Eviction is an approximate LRU with two
+    generations: terms not used since the previous generation was retired are dropped.
+    """
+
+    def __init__(self, serialize, size=TERM_CACHE_SIZE):
+        self.serialize = serialize
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.__young = {}
+        self.__old = {}
+
+    def __call__(self, term):
+        key = term_key(term)
+        value = self.__young.get(key)
+        if value is None:
+            value = self.__old.get(key)
+            if value is None:
+                value = self.serialize(term)
+                self.misses += 1
+            else:
+                self.hits += 1
+            if len(self.__young) >= self.size // 2:
+                self.__old = self.__young
+                self.__young = {}
+            self.__young[key] = value
+        else:
+            self.hits += 1
+        return value
+
+    @property
+    def stats(self):
+        return {
+            'size': self.size,
+            'entries': len(self.__young) + len([t for t in self.__old if t not in self.__young]),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def n3_cache(namespace_manager, size=TERM_CACHE_SIZE):
+    return TermCache(lambda t: t.n3(namespace_manager), size=size)
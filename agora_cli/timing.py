@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+"""
+import threading
+import time
+from functools import wraps
+
+__author__ = 'Fernando Serena'
+
+
+class NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class Phase(object):
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, time.time() - self.start)
+        return False
+
+
+no_phase = NoPhase()
+
+
+class Timings(object):
+    """
+    Time spent and number of calls per phase of a run. Phases that run in several threads at once add up their
+    times, so they may sum more than the elapsed time. Nothing is measured until it is enabled.
+    A thread can also track the phases it runs by itself, apart from those of any other thread (see track).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.__lock = threading.Lock()
+        self.__phases = {}
+        self.__local = threading.local()
+
+    def add(self, phase, seconds, count=1):
+        if not self.enabled:
+            return
+        with self.__lock:
+            accumulate(self.__phases, phase, seconds, count)
+        tracked = getattr(self.__local, 'phases', None)
+        if tracked is not None:
+            accumulate(tracked, phase, seconds, count)
+
+    def track(self):
+        """
+        Starts tracking the phases run by the calling thread, until untrack returns them.
+        """
+        self.__local.phases = {}
+
+    def untrack(self):
+        tracked = getattr(self.__local, 'phases', None) or {}
+        self.__local.phases = None
+        return dict([(phase, tuple(acc)) for phase, acc in tracked.items()])
+
+    def phase(self, name):
+        return Phase(self, name) if self.enabled else no_phase
+
+    def timed(self, name):
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return f(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self):
+        with self.__lock:
+            return dict([(phase, tuple(acc)) for phase, acc in self.__phases.items()])
+
+    def summary(self, since=None):
+        return summarize(self.snapshot(), since=since)
+
+
+def accumulate(phases, phase, seconds, count):
+    acc = phases.setdefault(phase, [0, 0.0])
+    acc[0] += count
+    acc[1] += seconds
+
+
+def summarize(phases, since=None):
+    since = since or {}
+    summary = {}
+    for phase, (count, seconds) in phases.items():
+        count -= since.get(phase, (0, 0.0))[0]
+        seconds -= since.get(phase, (0, 0.0))[1]
+        if count or seconds > 0:
+            summary[phase] = {'count': count, 'seconds': round(seconds, 4)}
+    return summary
+
+
+timings = Timings()
+
+
+def phase(name):
+    return timings.phase(name)
+
+
+def timed(name):
+    return timings.timed(name)
+
+
+class Split(object):
+    """
+    Iterates over a result generator within a with block, telling the time spent producing its items (crawl)
+    from the time the block spends writing them out (serialization).
+    """
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.items = 0
+        self.produced = 0.0
+
+    def __iter__(self):
+        it = iter(self.iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.produced += time.time() - start
+                return
+            self.produced += time.time() - start
+            self.items += 1
+            yield item
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        timings.add('crawl', self.produced, count=self.items)
+        timings.add('serialization', time.time() - self.start - self.produced)
+        return False
+
+
+class NoSplit(object):
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def split(iterable):
+    return Split(iterable) if timings.enabled else NoSplit(iterable)
+
+
+class TimedPlanner(object):
+    """
+    Planner that adds the search plans it makes to the planning phase.
+    """
+
+    def __init__(self, planner):
+        self.planner = planner
+
+    def make_plan(self, *args, **kwargs):
+        with phase('planning'):
+            return self.planner.make_plan(*args, **kwargs)
+
+    def __getattr__(self, item):
+        return getattr(self.planner, item)
+
+
+def time_planner(agora):
+    if timings.enabled and not isinstance(agora.planner, TimedPlanner):
+        agora.planner = TimedPlanner(agora.planner)
+    return agora
+
+
+class Profiler(object):
+    """
+    cProfile for every thread of the process: threads started after enabling it get their own profile, and all of
+    them are merged when dumped. Servers profile each request on its own instead (see instrument_app).
+    """
+
+    def __init__(self, path):
+        import cProfile
+
+        self.path = path
+        self.__main = cProfile.Profile()
+        self.__profiles = []
+        self.__lock = threading.Lock()
+        self.__stats = None
+        self.__per_request = False
+
+    def __thread_profile(self, *args):
+        import cProfile
+        import sys
+
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self.__lock:
+            self.__profiles.append(profile)
+        profile.enable()
+
+    def enable(self):
+        threading.setprofile(self.__thread_profile)
+        self.__main.enable()
+
+    def per_request(self):
+        """
+        Stops profiling the whole process, from now on only added profiles (one per request) are dumped.
+        """
+        threading.setprofile(None)
+        self.__main.disable()
+        with self.__lock:
+            self.__per_request = True
+            self.__profiles = []
+
+    def add(self, profile):
+        import pstats
+
+        with self.__lock:
+            try:
+                if self.__stats is None:
+                    self.__stats = pstats.Stats(profile)
+                else:
+                    self.__stats.add(profile)
+            except TypeError:
+                return
+            self.__stats.dump_stats(self.path)
+
+    def dump(self):
+        import pstats
+
+        threading.setprofile(None)
+        self.__main.disable()
+        with self.__lock:
+            profiles = [] if self.__per_request else [self.__main] + self.__profiles
+            stats = self.__stats
+            for profile in profiles:
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(profile)
+                    else:
+                        stats.add(profile)
+                except TypeError:
+                    # Threads that never ran Python code leave empty profiles
+                    pass
+            if stats is not None:
+                stats.dump_stats(self.path)
+
+
+def instrument_app(app, profiler=None, report=None):
+    """
+    Measures every request of a Flask app: its profile is added to the profiler and the timings of the phases
+    that ran while it was served are passed to report. Streamed responses are measured until they are closed.
+    Phases run by the thread serving the request (planning, crawl, serialization...) are reported as its own;
+    those run meanwhile by agora's shared worker threads (e.g. dereferencing) are reported as background, and
+    only belong to this request when requests are served one at a time.
+    """
+    from flask import request
+
+    if profiler is not None:
+        profiler.per_request()
+
+    @app.before_request
+    def start_request():
+        request.environ['agora.timings'] = (time.time(), timings.snapshot())
+        timings.track()
+        if profiler is not None:
+            import cProfile
+
+            profile = cProfile.Profile()
+            request.environ['agora.profile'] = profile
+            profile.enable()
+
+    @app.after_request
+    def end_request(response):
+        environ = request.environ
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+
+        def finish():
+            profile = environ.get('agora.profile')
+            if profile is not None:
+                profile.disable()
+                profiler.add(profile)
+            if report is not None and 'agora.timings' in environ:
+                start, since = environ['agora.timings']
+                own = timings.untrack()
+                # Whatever other threads ran meanwhile: shared workers, or other requests served concurrently
+                for phase, (count, seconds) in own.items():
+                    since_count, since_seconds = since.get(phase, (0, 0.0))
+                    since[phase] = (since_count + count, since_seconds + seconds)
+                report({
+                    'route': route,
+                    'status': response.status_code,
+                    'total': round(time.time() - start, 4),
+                    'phases': summarize(own),
+                    'background': timings.summary(since=since)
+                })
+
+        response.call_on_close(finish)
+        return response
+
+    return app
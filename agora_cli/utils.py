@@ -23,9 +23,6 @@ import os.path as path
 import zipfile
 
 import click
-from agora_gw.data.repository import CORE
-from agora_gw.ecosystem.serialize import serialize_graph
-from rdflib import URIRef, RDF
 
 __author__ = 'Fernando Serena'
 
@@ -40,6 +37,9 @@ def split_arg(a):
 
 
 def show_ted(ted, format):
+    from agora_gw.data.repository import CORE
+    from agora_gw.ecosystem.serialize import serialize_graph
+
     g = ted.to_graph()
     ttl = serialize_graph(g, format, frame=CORE.ThingEcosystemDescription, skolem=False)
     click.echo(ttl)
@@ -50,19 +50,48 @@ def error(msg):
 
 
 def show_td(td, format):
+    from agora_gw.data.repository import CORE
+    from agora_gw.ecosystem.serialize import serialize_graph
+
     g = td.to_graph()
     ttl = serialize_graph(g, format, frame=CORE.ThingDescription, skolem=False)
     click.echo(ttl)
 
 
 def show_thing(g, format):
+    from agora_gw.ecosystem.serialize import serialize_graph
+    from rdflib import URIRef, RDF
+
     th_node = g.identifier
     th_types = list(g.objects(URIRef(th_node), RDF.type))
     th_type = th_types.pop() if th_types else None
-    ttl = serialize_graph(g, format, frame=th_type, skolem=False)
+    if format == 'text/turtle':
+        ttl = serialize_graph(g, format, frame=th_type, skolem=False)
+    else:
+        ttl = serialize_jsonld(g, frame=th_type)
     click.echo(ttl)
 
 
+def serialize_jsonld(g, frame=None):
+    """
+    Same JSON-LD as serialize_graph, but the intermediate N-Triples are written through a term cache instead of
+    rdflib's per-character escaping serializer.
+    """
+    from agora_wot.gateway.publish import build_graph_context
+    from pyld import jsonld
+
+    from agora_cli.terms import TermCache, nt_term
+
+    n3 = TermCache(nt_term)
+    nt = u''.join([u'{} {} {} .\n'.format(n3(s), n3(p), n3(o)) for s, p, o in g])
+    context = build_graph_context(g)
+    ld = jsonld.from_rdf(nt)
+    if frame is not None:
+        ld = jsonld.frame(ld, {'context': context, '@type': str(frame)})
+    ld = jsonld.compact(ld, context)
+    return json.dumps(ld, indent=3, sort_keys=True)
+
+
 def compress(path, out):
     def zipdir(ziph):
         for root, dirs, files in os.walk(path):
@@ -124,6 +153,7 @@ def store_config(**kwargs):
     with open('.agora/config', 'wb') as f:
         json.dump(config, f, indent=3)
     store_host_replacements({})
+    store_host_limits({})
 
 
 def load_config():
@@ -162,3 +192,16 @@ def load_host_replacements():
 def store_host_replacements(repls):
     with open('.agora/repls', 'wb') as f:
         json.dump(repls, f, indent=3)
+
+
+def load_host_limits():
+    if is_init():
+        if not path.exists('.agora/limits'):
+            return {}
+        with open('.agora/limits', 'r') as f:
+            return json.load(f)
+
+
+def store_host_limits(limits):
+    with open('.agora/limits', 'wb') as f:
+        json.dump(limits, f, indent=3)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+Measures the encode/decode cost of the cache codec against the memory it saves, for synthetic resource graphs
+(Turtle, as cached) and fragment stream members, at several zlib levels with and without a namespace dictionary:
+
+    python benchmarks/cache_compression.py --resources 500 --triples 40
+"""
+import json
+import os
+import sys
+import time
+
+import click
+from rdflib import Graph, Namespace, Literal, RDF
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agora_cli.codec import Codec
+
+__author__ = 'Fernando Serena'
+
+EX = Namespace('http://example.org/ns#')
+DATA = Namespace('http://example.org/things/')
+FOAF = Namespace('http://xmlns.com/foaf/0.1/')
+DICTIONARY = [str(EX), str(DATA), str(FOAF), str(RDF)]
+
+
+def resources(n, triples):
+    predicates = [EX['p{}'.format(i)] for i in range(10)] + [FOAF.name, FOAF.knows]
+    for r in xrange(n):
+        g = Graph()
+        s = DATA[str(r)]
+        g.add((s, RDF.type, EX['Type{}'.format(r % 10)]))
+        for i in xrange(triples):
+            p = predicates[i % len(predicates)]
+            o = DATA[str((r * 7 + i) % n)] if i % 2 else Literal('value {} of {}'.format(i, r))
+            g.add((s, p, o))
+        yield g
+
+
+def members(graphs):
+    for g in graphs:
+        for s, p, o in g:
+            yield str(('?s ?p ?o', s.n3(), p.n3(), o.n3()))
+
+
+def measure(codec, values, encode, decode):
+    start = time.time()
+    encoded = map(encode, values)
+    encode_time = time.time() - start
+    start = time.time()
+    for value in encoded:
+        decode(value)
+    decode_time = time.time() - start
+
+    raw = sum(map(len, values))
+    stored = sum(map(len, encoded))
+    return {
+        'ratio': round(raw / float(stored), 3),
+        'saved_bytes': raw - stored,
+        'encode_mb_per_second': round(raw / encode_time / 1e6, 2),
+        'decode_mb_per_second': round(raw / decode_time / 1e6, 2)
+    }
+
+
+@click.command()
+@click.option('--resources', 'n', type=int, default=500)
+@click.option('--triples', type=int, default=40)
+def cache_compression(n, triples):
+    graphs = list(resources(n, triples))
+    data = [g.serialize(format='turtle') for g in graphs]
+    stream = list(members(graphs))
+
+    report = {
+        'resources': n,
+        'resource_bytes': sum(map(len, data)),
+        'members': len(stream),
+        'member_bytes': sum(map(len, stream))
+    }
+    for level in [1, 6, 9]:
+        for dictionary in [False, True]:
+            codec = Codec(level=level, version=1 if dictionary else 0, dictionary=DICTIONARY if dictionary else None)
+            name = 'level_{}{}'.format(level, '_dictionary' if dictionary else '')
+            report[name] = {'resources': measure(codec, data, codec.encode, codec.decode)}
+            if dictionary:
+                report[name]['members'] = measure(codec, stream, codec.encode_member, codec.decode_member)
+    click.echo(json.dumps(report, indent=3, sort_keys=True))
+
+
+if __name__ == '__main__':
+    cache_compression()
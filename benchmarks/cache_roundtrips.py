@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+Counts the Redis round trips of crawling a fragment whose resources are already in a (redislite) resource cache,
+with agora's RedisCache and with the CLI cache tier, which looks resources up in one round trip and prefetches the
+links of each crawled resource in batches. An optional latency per round trip stands in for a remote Redis:
+
+    python benchmarks/cache_roundtrips.py --resources 2000 --links 4 --latency 0.5
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import click
+from rdflib import Graph, Namespace, URIRef, Literal, RDF
+from redis.connection import Connection
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agora_cli.cache import MemoryCache, cache_settings
+
+__author__ = 'Fernando Serena'
+
+EX = Namespace('http://example.org/ns#')
+DATA = Namespace('http://example.org/things/')
+
+round_trips = [0]
+
+
+def counting(send, latency):
+    def wrapper(self, command):
+        # Only the crawl is measured, not the purge threads of RedisCache
+        if isinstance(threading.current_thread(), threading._MainThread):
+            round_trips[0] += 1
+            if latency:
+                time.sleep(latency / 1000.0)
+        return send(self, command)
+
+    return wrapper
+
+
+def loader(n, links):
+    def load(uri, format=None):
+        i = int(uri.split('/')[-1])
+        g = Graph(identifier=uri)
+        g.add((URIRef(uri), RDF.type, EX.Thing))
+        g.add((URIRef(uri), EX.label, Literal('thing {}'.format(i))))
+        for j in range(1, links + 1):
+            if i * links + j < n:
+                g.add((URIRef(uri), EX.link, DATA[str(i * links + j)]))
+        return g, {'Cache-Control': 'max-age=3600'}
+
+    return load
+
+
+def crawl(cache, load):
+    seed = DATA['0']
+    seen = set([seed])
+    pending = [seed]
+    while pending:
+        uri = pending.pop(0)
+        g, _ = cache.create(gid=uri, loader=load, format='turtle')
+        for o in g.objects(URIRef(uri), EX.link):
+            if o not in seen:
+                seen.add(o)
+                pending.append(o)
+    return len(seen)
+
+
+def measure(cache, load):
+    round_trips[0] = 0
+    start = time.time()
+    resources = crawl(cache, load)
+    return {
+        'resources': resources,
+        'round_trips': round_trips[0],
+        'round_trips_per_resource': round(round_trips[0] / float(resources), 2),
+        'elapsed': round(time.time() - start, 3)
+    }
+
+
+@click.command()
+@click.option('--resources', 'n', type=int, default=2000)
+@click.option('--links', type=int, default=4)
+@click.option('--latency', type=float, default=0.0, help='Milliseconds added to every round trip')
+def cache_roundtrips(n, links, latency):
+    from agora import RedisCache
+
+    base = tempfile.mkdtemp()
+    try:
+        settings = cache_settings(cache_file=os.path.join(base, 'data.db'))
+        load = loader(n, links)
+
+        # Fill the cache
+        crawl(MemoryCache(RedisCache(**settings)), load)
+
+        Connection.send_packed_command = counting(Connection.send_packed_command, latency)
+        report = {
+            'latency_ms': latency,
+            'redis_cache': measure(RedisCache(**settings), load),
+            'cli_cache': measure(MemoryCache(RedisCache(**settings)), load)
+        }
+        click.echo(json.dumps(report, indent=3, sort_keys=True))
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    cache_roundtrips()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+Dereferences synthetic JSON-LD and Turtle resources from a local mock HTTP server (with a fixed latency per
+response), one fresh connection per request as endpoints did before, and through the loader with pooled keep-alive
+sessions at several concurrencies:
+
+    python benchmarks/dereference_pool.py --resources 500 --latency 5 --concurrency 1 --concurrency 8
+"""
+import json
+import os
+import sys
+import time
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from threading import Lock, Thread
+
+import click
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agora_cli.loader import HTTPLoader
+
+__author__ = 'Fernando Serena'
+
+JSONLD = 'application/ld+json'
+TURTLE = 'text/turtle'
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    latency = 0.0
+    connections = 0
+    lock = Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients closing their keep-alive connections
+        pass
+
+
+class ResourceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Responses leave in one segment, otherwise keep-alive connections stall on delayed ACKs
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        i = int(self.path.rstrip('/').split('/')[-1])
+        uri = 'http://{}:{}{}'.format(self.server.server_name, self.server.server_port, self.path)
+        if TURTLE in self.headers.get('Accept', ''):
+            media = TURTLE
+            body = '<{0}> a <http://example.org/ns#Thing> ; <http://example.org/ns#label> "thing {1}" .\n'.format(
+                uri, i)
+        else:
+            media = JSONLD
+            body = json.dumps({'@id': uri, '@type': 'http://example.org/ns#Thing',
+                               'http://example.org/ns#label': 'thing {}'.format(i)})
+
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', media)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'max-age=60')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(latency):
+    server = MockServer(('127.0.0.1', 0), ResourceHandler)
+    server.latency = latency / 1000.0
+    th = Thread(target=server.serve_forever)
+    th.daemon = True
+    th.start()
+    return server
+
+
+def measure(server, hrefs, get, concurrency):
+    server.connections = 0
+    start = time.time()
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    statuses = list(pool.map(get, hrefs))
+    pool.shutdown()
+    elapsed = time.time() - start
+    return {
+        'concurrency': concurrency,
+        'errors': len([s for s in statuses if s != 200]),
+        'connections': server.connections,
+        'elapsed': round(elapsed, 3),
+        'resources_per_second': round(len(hrefs) / elapsed, 2)
+    }
+
+
+@click.command()
+@click.option('--resources', 'n', type=int, default=500)
+@click.option('--latency', type=float, default=5.0, help='Milliseconds the server takes to answer')
+@click.option('--concurrency', multiple=True, type=int)
+def dereference_pool(n, latency, concurrency):
+    server = serve(latency)
+    base = 'http://127.0.0.1:{}/things/'.format(server.server_port)
+    hrefs = [(base + str(i), JSONLD if i % 2 else TURTLE) for i in range(n)]
+
+    def fresh(href_media):
+        href, media = href_media
+        return requests.get(href, headers={'Accept': media}, timeout=30).status_code
+
+    report = {
+        'resources': n,
+        'latency_ms': latency,
+        'fresh_connections': measure(server, hrefs, fresh, 1),
+        'pooled': []
+    }
+    for c in concurrency or (1, 8):
+        loader = HTTPLoader(concurrency=c)
+        report['pooled'].append(measure(server, hrefs, lambda (href, media): loader.get(href, media).status_code, c))
+        loader.close()
+
+    server.shutdown()
+    click.echo(json.dumps(report, indent=3, sort_keys=True))
+
+
+if __name__ == '__main__':
+    dereference_pool()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+Rewrites synthetic URIs with a few hundred host replacement bases, checking every base against each URI (as
+replacements were applied before) and through the compiled prefix trie:
+
+    python benchmarks/host_rewrite.py --uris 1000000 --bases 300
+"""
+import json
+import os
+import random
+import sys
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agora_cli.hosts import Hosts
+
+__author__ = 'Fernando Serena'
+
+
+def linear_rewrite(repls):
+    def rewrite(uri):
+        match = None
+        for base in repls:
+            if uri.startswith(base) and (match is None or len(base) > len(match)):
+                match = base
+        if match is None:
+            return uri
+        return repls[match] + uri[len(match):]
+
+    return rewrite
+
+
+def replacements(n):
+    # Several bases per host, some of them nested, like versioned APIs behind the same domain
+    repls = {}
+    for i in range(n):
+        host = 'http://api{}.example.org'.format(i // 3)
+        base = '{}/v{}/'.format(host, i % 3) if i % 3 else host + '/'
+        repls[base] = 'http://127.0.0.1:{}/'.format(8000 + i)
+    return repls
+
+
+def uris(n, repls, matching):
+    bases = sorted(repls)
+    rnd = random.Random(0)
+    for i in xrange(n):
+        if rnd.random() < matching:
+            base = rnd.choice(bases)
+        else:
+            base = 'http://other{}.example.com/'.format(rnd.randint(0, 100))
+        yield '{}things/{}?page={}'.format(base, i, i % 7)
+
+
+def run(rewrite, batch):
+    start = time.time()
+    for uri in batch:
+        rewrite(uri)
+    return time.time() - start
+
+
+@click.command()
+@click.option('--uris', 'n', type=int, default=1000000)
+@click.option('--bases', type=int, default=300)
+@click.option('--matching', type=float, default=0.8, help='Fraction of URIs under some base')
+def host_rewrite(n, bases, matching):
+    repls = replacements(bases)
+    batch = list(uris(n, repls, matching))
+
+    start = time.time()
+    hosts = Hosts(repls)
+    compile_time = time.time() - start
+
+    linear = linear_rewrite(repls)
+    assert all(hosts.rewrite(uri) == linear(uri) for uri in batch[:10000])
+
+    linear_time = run(linear, batch)
+    trie_time = run(hosts.rewrite, batch)
+    click.echo(json.dumps({
+        'uris': n,
+        'bases': len(repls),
+        'compile_ms': round(compile_time * 1000, 2),
+        'linear': {'elapsed': round(linear_time, 3), 'uris_per_second': int(n / linear_time)},
+        'trie': {'elapsed': round(trie_time, 3), 'uris_per_second': int(n / trie_time)},
+        'speedup': round(linear_time / trie_time, 1)
+    }, indent=3, sort_keys=True))
+
+
+if __name__ == '__main__':
+    host_rewrite()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+Measures the throughput (rows/s) of the `agora query` output pipeline on a synthetic row generator, comparing
+the buffered writer with the former one-echo-per-character path:
+
+    python benchmarks/query_stream.py --rows 100000
+"""
+import json
+import os
+import sys
+import time
+from Queue import Queue, Empty
+from threading import Thread
+
+import click
+from agora.engine.utils import Semaphore
+from rdflib import URIRef, Literal, XSD
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agora_cli.query import gen_thread, head, result
+from agora_cli.stream import StreamQueue, gen_queue, write_chunks
+
+__author__ = 'Fernando Serena'
+
+
+class Row(object):
+    labels = ('s', 'name', 'age')
+
+    def __init__(self, i):
+        self.__values = {
+            's': URIRef('http://example.org/things/{}'.format(i)),
+            'name': Literal(u'Thing {}'.format(i), lang='en'),
+            'age': Literal(i % 100, datatype=XSD.integer)
+        }
+
+    def __getitem__(self, item):
+        return self.__values[item]
+
+
+def rows(n):
+    for i in xrange(n):
+        yield Row(i)
+
+
+def legacy_gen_thread(status, queue, gen):
+    first = True
+    for row in gen:
+        if first:
+            queue.put(u'{\n')
+            queue.put(u'  "head": %s,\n  "results": {\n    "bindings": [\n' % json.dumps(head(row)))
+            first = False
+        else:
+            queue.put(',\n')
+        queue.put(u'      {}'.format(json.dumps(result(row), ensure_ascii=False)))
+    queue.put('\n    ]\n  }\n')
+    queue.put('}')
+    status['completed'] = True
+
+
+def legacy_gen_queue(status, queue):
+    while not status['completed'] or not queue.empty():
+        try:
+            for chunk in queue.get(timeout=1.0):
+                yield chunk
+        except Empty:
+            pass
+
+
+def run(producer, consumer, n, queue):
+    status = {'completed': False, 'exception': None}
+    th = Thread(target=producer, args=(status, queue, rows(n)))
+    start = time.time()
+    th.start()
+    consumer(status, queue)
+    th.join()
+    return n / (time.time() - start)
+
+
+@click.command()
+@click.option('--rows', 'n', type=int, default=100000)
+def query_stream(n):
+    with open(os.devnull, 'wb') as null:
+        def buffered(status, queue):
+            write_chunks(gen_queue(status, Semaphore(), queue), out=null)
+
+        def legacy(status, queue):
+            for chunk in legacy_gen_queue(status, queue):
+                click.echo(chunk, nl=False, file=null)
+
+        report = {
+            'rows': n,
+            'buffered_rows_per_second': round(run(gen_thread, buffered, n, StreamQueue())),
+            'legacy_rows_per_second': round(run(legacy_gen_thread, legacy, n, Queue()))
+        }
+    click.echo(json.dumps(report, indent=3, sort_keys=True))
+
+
+if __name__ == '__main__':
+    query_stream()
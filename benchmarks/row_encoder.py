@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+Compares the rows/s of the precompiled SPARQL JSON RowEncoder with the per-row result() + json.dumps path, on
+synthetic rows whose URIs and datatypes repeat like in a real crawl:
+
+    python benchmarks/row_encoder.py --rows 200000 --distinct 1000
+"""
+import json
+import os
+import sys
+import time
+
+import click
+from rdflib import URIRef, Literal, XSD
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agora_cli.query import RowEncoder, head, result
+
+__author__ = 'Fernando Serena'
+
+
+class Row(object):
+    labels = ('s', 'type', 'name', 'value')
+
+    def __init__(self, values):
+        self.__values = values
+
+    def __getitem__(self, item):
+        return self.__values.get(item)
+
+
+def rows(n, distinct):
+    types = [URIRef('http://example.org/ns#Type{}'.format(i)) for i in range(10)]
+    for i in xrange(n):
+        yield Row({
+            's': URIRef('http://example.org/things/{}'.format(i % distinct)),
+            'type': types[i % len(types)],
+            'name': Literal(u'Thing {}'.format(i % distinct), lang='en'),
+            'value': Literal(i % 100, datatype=XSD.integer)
+        })
+
+
+def rate(encode, data):
+    start = time.time()
+    for row in data:
+        encode(row)
+    return len(data) / (time.time() - start)
+
+
+@click.command()
+@click.option('--rows', 'n', type=int, default=200000)
+@click.option('--distinct', type=int, default=1000)
+def row_encoder(n, distinct):
+    data = list(rows(n, distinct))
+    encoder = RowEncoder(head(data[0])['vars'])
+    report = {
+        'rows': n,
+        'distinct_subjects': distinct,
+        'encoder_rows_per_second': round(rate(encoder.encode, data)),
+        'result_rows_per_second': round(rate(lambda r: json.dumps(result(r), ensure_ascii=False), data))
+    }
+    click.echo(json.dumps(report, indent=3, sort_keys=True))
+
+
+if __name__ == '__main__':
+    row_encoder()
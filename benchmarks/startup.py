@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+Measures the wall time of a few short-lived agora invocations and the import time of every command module, and
+lists the heavy modules (gateway, web servers, redis) that commands not reaching the gateway still import.
+Run it from anywhere; it initializes a throwaway Agora in a temporary directory:
+
+    python benchmarks/startup.py --runs 10
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+__author__ = 'Fernando Serena'
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+AGORA = [sys.executable, '-c', 'from agora_cli.root import cli; cli(prog_name="agora")']
+
+INVOCATIONS = [
+    ['--version'],
+    ['show', 'config'],
+    ['list', 'tds']
+]
+
+IMPORT_TIME = 'import time; t = time.time(); import {}; print(time.time() - t)'
+
+# Commands that never reach the gateway, and the modules they must not import
+LIGHT_INVOCATIONS = [
+    ['--version'],
+    ['show', 'config']
+]
+
+HEAVY_MODULES = ['agora_gw', 'flask', 'gunicorn', 'redis']
+
+LOADED = """
+import sys
+from agora_cli.root import cli
+try:
+    cli.main({args!r}, prog_name='agora')
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(sorted(set(m.split('.')[0] for m in sys.modules) & set({heavy!r}))) + '\\n')
+"""
+
+
+def env():
+    e = dict(os.environ)
+    e['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, e.get('PYTHONPATH')]))
+    return e
+
+
+def timed(cmd, cwd):
+    with open(os.devnull, 'w') as null:
+        start = time.time()
+        code = subprocess.call(cmd, cwd=cwd, env=env(), stdout=null, stderr=null)
+        return time.time() - start, code
+
+
+def heavy_modules(args, cwd):
+    cmd = [sys.executable, '-c', LOADED.format(args=args, heavy=HEAVY_MODULES)]
+    with open(os.devnull, 'w') as null:
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env(), stdout=null, stderr=subprocess.PIPE)
+        _, err = proc.communicate()
+    lines = err.strip().splitlines()
+    return lines[-1].split() if lines else []
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        'min': round(samples[0], 4),
+        'median': round(samples[len(samples) // 2], 4),
+        'max': round(samples[-1], 4)
+    }
+
+
+@click.command()
+@click.option('--runs', type=int, default=5)
+def startup(runs):
+    from agora_cli.root import COMMANDS
+
+    base = tempfile.mkdtemp()
+    try:
+        timed(AGORA + ['init'], base)
+        report = {'invocations': {}, 'imports': {}}
+        for args in INVOCATIONS:
+            samples = []
+            code = 0
+            for _ in range(runs):
+                elapsed, code = timed(AGORA + args, base)
+                samples.append(elapsed)
+            res = summary(samples)
+            res['exit_code'] = code
+            report['invocations'][' '.join(['agora'] + args)] = res
+
+        report['heavy_modules'] = dict([(' '.join(['agora'] + args), heavy_modules(args, base))
+                                        for args in LIGHT_INVOCATIONS])
+
+        for module in sorted(set(COMMANDS.values()) | {'agora_cli.root'}):
+            samples = []
+            for _ in range(runs):
+                out = subprocess.check_output([sys.executable, '-c', IMPORT_TIME.format(module)], cwd=base, env=env())
+                samples.append(float(out.strip().splitlines()[-1]))
+            report['imports'][module] = summary(samples)
+
+        click.echo(json.dumps(report, indent=3, sort_keys=True))
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == '__main__':
+    startup()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Copyright (C) 2018 Fernando Serena
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+            http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+#-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+Measures the triples/s of the Turtle fragment writer on a synthetic fragment, with and without the term cache.
+Subjects, predicates and objects are drawn from pools so terms repeat as in a real crawl:
+
+    python benchmarks/term_cache.py --triples 200000 --subjects 5000
+"""
+import json
+import os
+import sys
+import time
+
+import click
+from rdflib import Graph, Namespace, Literal, RDF, XSD
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agora_cli.get import write_turtle
+from agora_cli.stream import ChunkBuffer
+from agora_cli.terms import n3_cache, nt_term, TermCache
+
+__author__ = 'Fernando Serena'
+
+EX = Namespace('http://example.org/ns#')
+DATA = Namespace('http://example.org/things/')
+
+
+def fragment(n, subjects, plan):
+    predicates = [RDF.type] + [EX['p{}'.format(i)] for i in range(20)]
+    types = [EX['Type{}'.format(i)] for i in range(10)]
+    quads = []
+    for i in xrange(n):
+        s = DATA[str(i % subjects)]
+        p = predicates[i % len(predicates)]
+        if p == RDF.type:
+            o = types[i % len(types)]
+        elif i % 2:
+            o = DATA[str((i * 7) % subjects)]
+        else:
+            o = Literal(i % 1000)
+        quads.append((None, s, p, o))
+    return {'plan': plan, 'prefixes': dict(plan.namespaces()), 'generator': iter(quads)}
+
+
+def check_literals():
+    # Literals that rdflib compares as equal must keep their own lexical form and language tag
+    literals = [Literal('1', datatype=XSD.integer), Literal('01', datatype=XSD.integer),
+                Literal('1.0', datatype=XSD.double), Literal('1.00', datatype=XSD.double),
+                Literal('x', lang='en'), Literal('x', lang='EN')]
+    cache = TermCache(nt_term)
+    for literal in literals + literals:
+        assert cache(literal) == nt_term(literal), nt_term(literal)
+
+
+def rate(n, subjects, plan, n3):
+    out = ChunkBuffer(lambda chunk, rows: None)
+    frag = fragment(n, subjects, plan)
+    start = time.time()
+    write_turtle(out, frag, n3)
+    out.flush()
+    return n / (time.time() - start)
+
+
+@click.command()
+@click.option('--triples', 'n', type=int, default=200000)
+@click.option('--subjects', type=int, default=5000)
+def term_cache(n, subjects):
+    check_literals()
+    plan = Graph()
+    plan.bind('ex', EX)
+    plan.bind('data', DATA)
+    nm = plan.namespace_manager
+
+    cache = n3_cache(nm)
+    report = {
+        'triples': n,
+        'subjects': subjects,
+        'cached_triples_per_second': round(rate(n, subjects, plan, cache)),
+        'uncached_triples_per_second': round(rate(n, subjects, plan, lambda t: t.n3(nm))),
+        'cache': cache.stats
+    }
+    click.echo(json.dumps(report, indent=3, sort_keys=True))
+
+
+if __name__ == '__main__':
+    term_cache()